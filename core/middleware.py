@@ -0,0 +1,13 @@
+from django.middleware.gzip import GZipMiddleware
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Gzip responses for clients that accept it, except event streams: gzip
+    buffers output, which would hold server-sent events back.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        return super().process_response(request, response)
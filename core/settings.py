@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,8 +62,18 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=15),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    # Tokens carry a hash of the user's password, checked against the user
+    # row on every request; this ties tokens issued from the login cache to
+    # the row they were issued for.
+    "CHECK_REVOKE_TOKEN": True,
 }
 
+# Seconds a user's login data stays cached by the login endpoint.
+LOGIN_CACHE_TTL = env.int('LOGIN_CACHE_TTL', default=300)
+# Also cache a keyed digest of verified passwords so cached logins skip the
+# password hasher. Faster, but weakens password hashing for cached entries.
+LOGIN_CACHE_VERIFIED_CREDENTIALS = env.bool('LOGIN_CACHE_VERIFIED_CREDENTIALS', default=False)
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -90,6 +101,24 @@ DATABASES = {
     'default': env.db('DATABASE_URL', default='sqlite:///db.sqlite3')
 }
 
+# Additional databases tenants can be sharded to, e.g.
+# SHARD_DATABASE_URLS=shard1=sqlite:///shard1.sqlite3,shard2=postgres://...
+DATABASES.update({
+    alias: env.db_url_config(url)
+    for alias, url in env.dict('SHARD_DATABASE_URLS', default={}).items()
+})
+
+DATABASE_ROUTERS = ['task_api.sharding.TenantShardRouter']
+
+
+# Cache
+# The login cache and token revocation list live here; use a shared backend
+# (e.g. CACHE_URL=redis://...) when running several workers.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
 
 # Password validation
 
@@ -129,3 +158,41 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom user model
 AUTH_USER_MODEL = 'task_api.User'
+
+
+# Background jobs
+
+BACKGROUND_TASKS_ASYNC = env.bool('BACKGROUND_TASKS_ASYNC', default=True)
+BACKGROUND_WORKERS = env.int('BACKGROUND_WORKERS', default=2)
+
+PRODUCT_IMPORT_CHUNK_SIZE = env.int('PRODUCT_IMPORT_CHUNK_SIZE', default=500)
+PRODUCT_IMPORT_MAX_ERRORS = env.int('PRODUCT_IMPORT_MAX_ERRORS', default=1000)
+# A running job whose progress has not moved for this long is treated as
+# abandoned (e.g. its process restarted) and may be requeued.
+PRODUCT_IMPORT_STALE_AFTER = timedelta(minutes=env.int('PRODUCT_IMPORT_STALE_MINUTES', default=30))
+
+
+# Product change events (server-sent events)
+
+PRODUCT_EVENTS_HISTORY_SIZE = env.int('PRODUCT_EVENTS_HISTORY_SIZE', default=1000)
+# Number of tenants (those that changed products most recently) whose
+# history is kept; bounds the history to this many times the size above.
+PRODUCT_EVENTS_HISTORY_TENANTS = env.int('PRODUCT_EVENTS_HISTORY_TENANTS', default=100)
+PRODUCT_EVENTS_QUEUE_SIZE = env.int('PRODUCT_EVENTS_QUEUE_SIZE', default=100)
+PRODUCT_EVENTS_HEARTBEAT = env.int('PRODUCT_EVENTS_HEARTBEAT', default=15)
+
+
+# Idempotency-Key support for product writes
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=env.int('IDEMPOTENCY_KEY_TTL_HOURS', default=24))
+# How long a claimed key whose request never finished (e.g. the worker was
+# killed) blocks retries before a retry may take it over. Must be longer than
+# the longest a request can run (the worker/proxy timeout; gunicorn's default
+# is 30 seconds), or a slow request could be run a second time.
+IDEMPOTENCY_KEY_LOCK_TIMEOUT = timedelta(seconds=env.int('IDEMPOTENCY_KEY_LOCK_TIMEOUT', default=600))
+
+
+# Soft delete and purge
+
+SOFT_DELETE_RETENTION = timedelta(days=env.int('SOFT_DELETE_RETENTION_DAYS', default=0))
+PURGE_BATCH_SIZE = env.int('PURGE_BATCH_SIZE', default=1000)
@@ -0,0 +1,37 @@
+"""
+Settings for running the test suite: `python manage.py test --parallel`.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+# Real password hashing dominates fixture setup; tests do not need it.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+# In-memory SQLite for the default database and one shard, so the sharding
+# tests run too. The test runner clones these per --parallel worker.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# API documentation is not under test.
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'drf_yasg']  # noqa: F405
+
+BACKGROUND_TASKS_ASYNC = False
+
+DEBUG = False
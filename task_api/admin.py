@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 from django.core.exceptions import PermissionDenied
-from .models import Tenant, User, Product
+from .models import IdempotencyKey, ImportJob, Tenant, User, Product
+from .purge import soft_delete_tenant
 
 
 @admin.register(Tenant)
@@ -18,6 +20,33 @@ class TenantAdmin(admin.ModelAdmin):
         'contact',
         'location'
     )
+    # Changing the shard without moving the rows would hide the tenant's
+    # products; use the move_tenant_shard command instead.
+    readonly_fields = ('shard',)
+
+    # Models whose rows the purge removes along with a tenant.
+    purged_models = (User, Product, ImportJob, IdempotencyKey)
+
+    def get_deleted_objects(self, objs, request):
+        """
+        Deleting is soft and the purge runs in the background, so skip
+        collecting every related row for the confirmation page. Delete
+        permission on the purged models is still required.
+        """
+        objs = list(objs)
+        perms_needed = set()
+        for model in self.purged_models:
+            model_admin = self.admin_site._registry.get(model)
+            if model_admin is not None and not model_admin.has_delete_permission(request):
+                perms_needed.add(model._meta.verbose_name)
+        return [str(obj) for obj in objs], {self.model._meta.verbose_name_plural: len(objs)}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        soft_delete_tenant(obj)
+
+    def delete_queryset(self, request, queryset):
+        for tenant in queryset:
+            soft_delete_tenant(tenant)
 
 
 @admin.register(User)
@@ -61,3 +90,71 @@ class ProductAdmin(admin.ModelAdmin):
         'name',
         'tenant__name'
     )
+    # Filtering by tenant lists (and bulk-deletes) products on its shard.
+    list_filter = ('tenant',)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        tenant_id = request.GET.get('tenant__id__exact')
+        tenant = Tenant.objects.filter(pk=tenant_id).first() if tenant_id and tenant_id.isdigit() else None
+        return queryset.using(tenant.shard) if tenant is not None else queryset
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            return obj
+        # Product ids are unique across databases, so look on the shards too.
+        queryset = self.get_queryset(request)
+        for alias in settings.DATABASES:
+            obj = queryset.using(alias).filter(pk=object_id).first() if str(object_id).isdigit() else None
+            if obj is not None:
+                return obj
+        return None
+
+    def delete_model(self, request, obj):
+        obj.soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        # One save per product, on the product's database, so every deletion
+        # reaches the product event streams.
+        for product in queryset:
+            product.soft_delete()
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'tenant',
+        'format',
+        'status',
+        'processed_rows',
+        'total_rows',
+        'failed_rows',
+        'created'
+    )
+    list_filter = (
+        'status',
+        'format'
+    )
+    search_fields = (
+        'tenant__name',
+    )
+    exclude = (
+        'source',
+    )
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = (
+        'key',
+        'tenant',
+        'status_code',
+        'created',
+        'expires_at'
+    )
+    search_fields = (
+        'key',
+        'tenant__name'
+    )
@@ -0,0 +1,158 @@
+from collections import OrderedDict, deque
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ProductEvent:
+    """
+    A change to a tenant's products, pre-encoded in the SSE wire format so it
+    is serialized once no matter how many streams deliver it.
+    """
+
+    def __init__(self, epoch, sequence, event_type, data):
+        self.id = f"{epoch}-{sequence}"
+        self.sequence = sequence
+        self.type = event_type
+        data = json.dumps(data, cls=JSONEncoder, separators=(',', ':'))
+        self.payload = f"id: {self.id}\nevent: {event_type}\ndata: {data}\n\n".encode('utf-8')
+
+
+RESET_EVENT = b"event: reset\ndata: {}\n\n"
+
+
+class Subscription:
+    """
+    One connected stream. Events are handed over to the subscriber's event
+    loop; if it falls more than ``max_pending`` events behind it is cut off
+    and the client resumes from the history with ``Last-Event-ID``.
+    """
+    CLOSED = None
+
+    def __init__(self, broker, tenant_id, loop, max_pending):
+        self.broker = broker
+        self.tenant_id = tenant_id
+        self.loop = loop
+        self.max_pending = max_pending
+        self.queue = asyncio.Queue()
+        self.backlog = []
+        self.overflowed = False
+
+    def push(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's loop has already shut down.
+            pass
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.max_pending:
+            self.overflowed = True
+            event = self.CLOSED
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class _TenantHistory:
+    def __init__(self, size, evicted_up_to):
+        self.events = deque(maxlen=size)
+        # Sequence of the newest event dropped from this history.
+        self.evicted_up_to = evicted_up_to
+
+
+class ProductEventBroker:
+    """
+    In-process fan-out of product events to the streams of each tenant, with a
+    bounded history for resuming after a reconnect: ``history_size`` events
+    for each of the ``history_tenants`` tenants that published most recently.
+
+    Event ids are ``<epoch>-<sequence>``; the epoch changes when the process
+    restarts, so ids from a previous process are recognised as unresumable.
+    """
+
+    def __init__(self, history_size=None, max_pending=None, history_tenants=None):
+        self.history_size = history_size or settings.PRODUCT_EVENTS_HISTORY_SIZE
+        self.max_pending = max_pending or settings.PRODUCT_EVENTS_QUEUE_SIZE
+        self.history_tenants = history_tenants or settings.PRODUCT_EVENTS_HISTORY_TENANTS
+        self.epoch = str(int(time.time() * 1000))
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._histories = OrderedDict()
+        # Newest event dropped along with a whole tenant history; tenants
+        # without a history cannot resume from before it.
+        self._pruned_up_to = 0
+        self._subscribers = {}
+
+    def _history_for(self, tenant_id):
+        history = self._histories.get(tenant_id)
+        if history is None:
+            history = self._histories[tenant_id] = _TenantHistory(self.history_size, self._pruned_up_to)
+            if len(self._histories) > self.history_tenants:
+                _, pruned = self._histories.popitem(last=False)
+                if pruned.events:
+                    self._pruned_up_to = max(self._pruned_up_to, pruned.events[-1].sequence)
+        else:
+            self._histories.move_to_end(tenant_id)
+        return history
+
+    def publish(self, tenant_id, event_type, data):
+        with self._lock:
+            self._sequence += 1
+            event = ProductEvent(self.epoch, self._sequence, event_type, data)
+            history = self._history_for(tenant_id)
+            if len(history.events) == history.events.maxlen:
+                history.evicted_up_to = history.events[0].sequence
+            history.events.append(event)
+            subscribers = list(self._subscribers.get(tenant_id, ()))
+        for subscription in subscribers:
+            subscription.push(event)
+        return event
+
+    def _parse_event_id(self, event_id):
+        epoch, _, sequence = (event_id or '').partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def subscribe(self, tenant_id, last_event_id=None):
+        """
+        Register a stream for ``tenant_id`` on the running event loop. Events
+        after ``last_event_id`` still in the history are put in the
+        subscription's ``backlog``; if some were lost the backlog starts with
+        a ``reset`` event telling the client to refetch.
+        """
+        subscription = Subscription(self, tenant_id, asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            if last_event_id:
+                history = self._histories.get(tenant_id)
+                events = history.events if history is not None else ()
+                evicted_up_to = history.evicted_up_to if history is not None else self._pruned_up_to
+                sequence = self._parse_event_id(last_event_id)
+                if sequence is None or sequence > self._sequence or sequence < evicted_up_to:
+                    subscription.backlog.append(RESET_EVENT)
+                    sequence = self._sequence
+                subscription.backlog.extend(event.payload for event in events if event.sequence > sequence)
+            self._subscribers.setdefault(tenant_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.tenant_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.tenant_id]
+
+
+broker = ProductEventBroker()
@@ -0,0 +1,118 @@
+from functools import wraps
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# Response headers stored with the first response and sent again on replay.
+STORED_HEADERS = ('Location', 'Content-Location')
+
+
+class IdempotencyKeyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed."
+    default_code = 'idempotency_key_in_progress'
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = 'idempotency_key_mismatch'
+
+
+def request_fingerprint(request):
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode('utf-8'))
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim_key(tenant, key, fingerprint):
+    """
+    Reserve ``key`` for the current request. Returns ``(record, created)``;
+    when ``created`` is false the record belongs to an earlier request.
+    """
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(tenant=tenant, key=key).first()
+    if record is not None:
+        abandoned = record.status_code is None and record.created <= now - settings.IDEMPOTENCY_KEY_LOCK_TIMEOUT
+        if record.expires_at > now and not abandoned:
+            return record, False
+        # Expired, or its request never finished: take the key over.
+        IdempotencyKey.objects.filter(pk=record.pk, status_code=record.status_code).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                tenant=tenant,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + settings.IDEMPOTENCY_KEY_TTL
+            )
+        return record, True
+    except IntegrityError:
+        # A concurrent request claimed the key first.
+        return IdempotencyKey.objects.get(tenant=tenant, key=key), False
+
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        raise IdempotencyKeyMismatch()
+    if record.status_code is None:
+        raise IdempotencyKeyInProgress()
+    data = json.loads(record.response_body) if record.response_body else None
+    headers = dict(record.response_headers, **{REPLAYED_HEADER: 'true'})
+    return Response(data, status=record.status_code, headers=headers)
+
+
+def idempotent(handler):
+    """
+    Make a write handler replay its first response, without running again,
+    when retried with the same ``Idempotency-Key`` header by the same tenant.
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        tenant = getattr(request.user, 'tenant', None)
+        if not key or tenant is None:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise ValidationError({IDEMPOTENCY_HEADER: ["Ensure this header has no more than 255 characters."]})
+
+        fingerprint = request_fingerprint(request)
+        record, created = claim_key(tenant, key, fingerprint)
+        if not created:
+            return replay(record, fingerprint)
+
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            # Failed requests are not recorded so the client can retry them.
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+
+        response_body = ''
+        if response.data is not None:
+            response_body = json.dumps(response.data, cls=JSONEncoder, separators=(',', ':'))
+        # Nothing is updated if a retry took the key over after the lock
+        # timeout; the retry's own response is the one kept.
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=response.status_code,
+            response_body=response_body,
+            response_headers={name: response[name] for name in STORED_HEADERS if response.has_header(name)}
+        )
+        return response
+    return wrapper
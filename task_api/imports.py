@@ -0,0 +1,214 @@
+from contextlib import nullcontext
+import csv
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+
+from .models import ImportJob, Product
+from .serializers import ProductWriteSerializer
+from .sharding import use_tenant_shard
+from .signals import products_bulk_created
+from . import tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+def iter_rows(job):
+    """
+    Yield ``(row_number, data)`` pairs from the job's source. Rows that cannot
+    be decoded yield ``None`` as data.
+    """
+    if job.format == ImportJob.FORMAT_CSV:
+        reader = csv.DictReader(io.StringIO(job.source))
+        for row_number, row in enumerate(reader, start=1):
+            yield row_number, {key: value for key, value in row.items() if key is not None}
+        return
+
+    row_number = 0
+    for line in io.StringIO(job.source):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        yield row_number, data if isinstance(data, dict) else None
+
+
+def _plain_errors(errors):
+    if isinstance(errors, dict):
+        return {field: _plain_errors(value) for field, value in errors.items()}
+    if isinstance(errors, list):
+        return [_plain_errors(value) for value in errors]
+    return str(errors)
+
+
+def _duplicate_error(name, tenant):
+    return {"name": [f"Product with name '{name}' already exists for the tenant '{tenant.name}'."]}
+
+
+class _ImportRun:
+    """
+    Book-keeping for a single pass over an import job, continuing from the
+    progress recorded by an earlier, interrupted pass.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.seen_names = set()
+        self.processed = job.processed_rows
+        self.created = job.created_rows
+        self.failed = job.failed_rows
+        self.errors = list(job.errors)
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < settings.PRODUCT_IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def import_chunk(self, chunk):
+        tenant = self.job.tenant
+        valid = []
+        for row_number, data in chunk:
+            if data is None:
+                self.add_error(row_number, {"non_field_errors": ["Row could not be parsed."]})
+                continue
+            serializer = ProductWriteSerializer(data=data)
+            if not serializer.is_valid():
+                self.add_error(row_number, _plain_errors(serializer.errors))
+                continue
+            name = serializer.validated_data['name']
+            if name in self.seen_names:
+                self.add_error(row_number, {"name": [f"Duplicate product name '{name}' in import file."]})
+                continue
+            self.seen_names.add(name)
+            valid.append((row_number, serializer.validated_data))
+
+        # One query per chunk replaces the per-row lookup done by Product.clean().
+        existing = dict(
+            Product.objects.filter(tenant=tenant, name__in=[data['name'] for _, data in valid])
+            .values_list('name', 'import_job_id')
+        )
+        products = []
+        for row_number, data in valid:
+            if data['name'] not in existing:
+                products.append((row_number, Product(tenant=tenant, import_job_id=self.job.pk, **data)))
+            elif existing[data['name']] == self.job.pk:
+                # Created by an earlier pass that stopped before recording it.
+                self.created += 1
+            else:
+                self.add_error(row_number, _duplicate_error(data['name'], tenant))
+
+        using = router.db_for_write(Product)
+        # On the job's database, the rows and the progress commit together.
+        same_database = using == router.db_for_write(ImportJob)
+        with transaction.atomic(using=using) if same_database else nullcontext():
+            self.create_products(products, using)
+            self.processed += len(chunk)
+            ImportJob.objects.filter(pk=self.job.pk).update(
+                processed_rows=self.processed,
+                created_rows=self.created,
+                failed_rows=self.failed,
+                errors=self.errors,
+                modified=timezone.now()
+            )
+
+    def create_products(self, products, using):
+        tenant = self.job.tenant
+        try:
+            with transaction.atomic(using=using):
+                Product.objects.bulk_create([product for _, product in products])
+            self.created += len(products)
+            if products:
+                products_bulk_created.send(sender=Product, tenant=tenant, count=len(products))
+        except IntegrityError:
+            # A concurrent writer claimed one of the names; fall back to
+            # saving row by row so only the conflicting rows fail.
+            for row_number, product in products:
+                product.pk = None
+                try:
+                    with transaction.atomic(using=using):
+                        product.save()
+                    self.created += 1
+                except (ValidationError, IntegrityError):
+                    self.add_error(row_number, _duplicate_error(product.name, tenant))
+
+
+def run_import_job(job_id):
+    """
+    Process a pending import job in chunked transactions, recording progress
+    on the job row after every chunk so clients can poll it. Rows already
+    processed by a requeued job are skipped.
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_PENDING).update(
+        status=ImportJob.STATUS_RUNNING,
+        started_at=now,
+        modified=now
+    )
+    if not claimed:
+        return
+
+    job = ImportJob.objects.select_related('tenant').get(pk=job_id)
+    run = _ImportRun(job)
+    try:
+        total = sum(1 for _ in iter_rows(job))
+        ImportJob.objects.filter(pk=job.pk).update(total_rows=total, modified=timezone.now())
+
+        chunk_size = settings.PRODUCT_IMPORT_CHUNK_SIZE
+        chunk = []
+        with use_tenant_shard(job.tenant):
+            for row in iter_rows(job):
+                if row[0] <= run.processed:
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    run.import_chunk(chunk)
+                    chunk = []
+            if chunk:
+                run.import_chunk(chunk)
+        status = ImportJob.STATUS_SUCCEEDED
+    except Exception as e:
+        logger.exception("Import job %s failed", job_id)
+        run.errors.append({"row": None, "errors": {"non_field_errors": [str(e)]}})
+        status = ImportJob.STATUS_FAILED
+
+    now = timezone.now()
+    ImportJob.objects.filter(pk=job.pk).update(
+        status=status,
+        errors=run.errors,
+        finished_at=now,
+        modified=now
+    )
+
+
+def requeue_stale_import_jobs(stale_after=None):
+    """
+    Return running jobs whose progress has not moved for ``stale_after``
+    (``PRODUCT_IMPORT_STALE_AFTER`` by default) to pending, so they can be
+    picked up again. Returns the ids of the requeued jobs.
+    """
+    if stale_after is None:
+        stale_after = settings.PRODUCT_IMPORT_STALE_AFTER
+    cutoff = timezone.now() - stale_after
+    stale = ImportJob.objects.filter(status=ImportJob.STATUS_RUNNING, modified__lt=cutoff)
+    job_ids = list(stale.values_list('pk', flat=True))
+    if job_ids:
+        stale.filter(pk__in=job_ids).update(status=ImportJob.STATUS_PENDING, modified=timezone.now())
+        logger.warning("Requeued stale import jobs %s", job_ids)
+    return job_ids
+
+
+def enqueue_import_job(job):
+    """
+    Schedule ``job`` on the background worker pool once the surrounding
+    transaction commits.
+    """
+    transaction.on_commit(lambda: tasks.submit(run_import_job, job.pk))
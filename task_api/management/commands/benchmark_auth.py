@@ -0,0 +1,70 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from task_api.models import Tenant, User
+from task_api.tokens import invalidate_cached_user
+from task_api.views import CachedTokenObtainPairView, CachedTokenRefreshView
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure logins/sec and refreshes/sec of a single worker for the stock and cached "
+        "token views. Creates a temporary tenant and user, deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--refreshes', type=int, default=2000)
+
+    def rate(self, view, data, iterations, before_each=None):
+        factory = APIRequestFactory()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            if before_each is not None:
+                before_each()
+            response = view(factory.post('/', data, format='json'))
+            assert response.status_code == 200, response.data
+        return iterations / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        username = f"auth-benchmark-{uuid.uuid4().hex}"
+        if User.objects.filter(username=username).exists():
+            raise CommandError(f"User '{username}' already exists.")
+
+        # The user is committed and deleted rather than rolled back: a rolled
+        # back id can be handed to the next real user, and deleting revokes
+        # the tokens issued during the run.
+        tenant = Tenant.objects.create(name=f"Auth Benchmark {username}")
+        try:
+            User.objects.create_user(username=username, password='benchmark-password', tenant=tenant)
+            self.run(username, options)
+        finally:
+            tenant.delete()
+            # Only drop the benchmark user's entry; the cache may be shared and
+            # holds the token revocation list.
+            invalidate_cached_user(username)
+
+    def run(self, username, options):
+        credentials = {'username': username, 'password': 'benchmark-password'}
+        invalidate_cached_user(username)
+
+        stock_login = TokenObtainPairView.as_view()
+        cached_login = CachedTokenObtainPairView.as_view()
+        refresh = cached_login(APIRequestFactory().post('/', credentials, format='json')).data['refresh']
+
+        results = [
+            ("login (stock)", self.rate(stock_login, credentials, options['logins'])),
+            ("login (cache miss)", self.rate(
+                cached_login, credentials, options['logins'],
+                before_each=lambda: invalidate_cached_user(username)
+            )),
+            ("login (cached)", self.rate(cached_login, credentials, options['logins'])),
+            ("refresh (stock)", self.rate(TokenRefreshView.as_view(), {'refresh': refresh}, options['refreshes'])),
+            ("refresh (cached)", self.rate(CachedTokenRefreshView.as_view(), {'refresh': refresh}, options['refreshes'])),
+        ]
+        for name, per_second in results:
+            self.stdout.write(f"{name:<20}{per_second:>12.1f}/s")
@@ -0,0 +1,72 @@
+from decimal import Decimal
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from task_api.models import Product, Tenant
+from task_api.serializers import ProductReadSerializer
+
+
+class Command(BaseCommand):
+    help = "Measure render time and bytes on the wire of a product list page. Uses no database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def make_products(self, rows):
+        tenant = Tenant(pk=1, name="Benchmark Tenant")
+        now = timezone.now()
+        return [
+            Product(
+                pk=i,
+                tenant=tenant,
+                name=f"Product {i}",
+                description=f"Description of product {i}",
+                price=Decimal(i % 10000) / 100,
+                quantity=i % 500,
+                created=now,
+                modified=now
+            )
+            for i in range(1, rows + 1)
+        ]
+
+    def measure(self, serialize, products, repeat):
+        renderer = JSONRenderer()
+        best_serialize = best_render = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = serialize(products)
+            serialized = time.perf_counter()
+            body = renderer.render(data)
+            rendered = time.perf_counter()
+            best_serialize = min(best_serialize, serialized - start)
+            best_render = min(best_render, rendered - serialized)
+        return best_serialize, best_render, body
+
+    def handle(self, *args, **options):
+        products = self.make_products(options['rows'])
+        variants = [
+            ("per-field serializer", lambda rows: serializers.ListSerializer(
+                rows, child=ProductReadSerializer()
+            ).data),
+            ("list serializer", lambda rows: ProductReadSerializer(rows, many=True).data),
+        ]
+
+        self.stdout.write(f"{options['rows']} rows, best of {options['repeat']}")
+        self.stdout.write(f"{'variant':<22}{'serialize ms':>14}{'render ms':>12}{'bytes':>12}{'gzip bytes':>12}")
+        bodies = []
+        for name, serialize in variants:
+            serialize_time, render_time, body = self.measure(serialize, products, options['repeat'])
+            bodies.append(body)
+            self.stdout.write(
+                f"{name:<22}{serialize_time * 1000:>14.1f}{render_time * 1000:>12.1f}"
+                f"{len(body):>12}{len(compress_string(body)):>12}"
+            )
+
+        if len(set(bodies)) != 1:
+            self.stderr.write("Variants rendered different payloads.")
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from task_api.models import Product, Tenant
+from task_api.signals import mute_product_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a tenant's products to another database. Products keep their ids, which are unique "
+        "across databases. Run it while the tenant is not writing, as changes made during the copy "
+        "are not carried over. If it fails, run it again: copied rows are skipped and the old copies "
+        "are removed once the tenant has switched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tenant', help="Tenant id or name.")
+        parser.add_argument('target', help="Database alias to move the tenant to.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def get_tenant(self, value):
+        lookup = {'pk': value} if value.isdigit() else {'name': value}
+        try:
+            return Tenant.objects.get(**lookup)
+        except Tenant.DoesNotExist:
+            raise CommandError(f"Tenant '{value}' does not exist.")
+
+    def batches(self, queryset, batch_size):
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def copy(self, tenant, source, target, batch_size):
+        """
+        Copy the tenant's products missing on ``target``, one transaction per
+        batch. Returns the number of rows copied.
+        """
+        copied = 0
+        products = Product.all_objects.using(source).filter(tenant=tenant)
+        for batch in self.batches(products, batch_size):
+            pks = [product.pk for product in batch]
+            existing = dict(
+                Product.all_objects.using(target).filter(pk__in=pks).values_list('pk', 'tenant_id')
+            )
+            if any(tenant_id != tenant.pk for tenant_id in existing.values()):
+                raise CommandError(
+                    f"Product ids of '{tenant.name}' collide with rows of another tenant on '{target}'."
+                )
+            missing = [product for product in batch if product.pk not in existing]
+            with transaction.atomic(using=target):
+                Product.all_objects.using(target).bulk_create(missing)
+            copied += len(missing)
+        return copied
+
+    def remove_copies(self, tenant, target, batch_size):
+        """
+        Delete the tenant's products on other databases that were copied to
+        ``target``. Returns the number of rows deleted.
+        """
+        removed = 0
+        # The rows now live on the target; drop the old copies without
+        # announcing products that still exist as deleted.
+        with mute_product_events():
+            for alias in settings.DATABASES:
+                if alias == target:
+                    continue
+                products = Product.all_objects.using(alias).filter(tenant=tenant)
+                for batch in self.batches(products.only('pk'), batch_size):
+                    pks = Product.all_objects.using(target).filter(
+                        tenant=tenant, pk__in=[product.pk for product in batch]
+                    ).values_list('pk', flat=True)
+                    removed += Product.all_objects.using(alias).filter(pk__in=list(pks)).delete()[0]
+        return removed
+
+    def handle(self, *args, **options):
+        tenant = self.get_tenant(options['tenant'])
+        source, target = tenant.shard, options['target']
+        batch_size = options['batch_size']
+        if target not in settings.DATABASES:
+            raise CommandError(f"Unknown database '{target}'.")
+
+        copied = 0
+        if source != target:
+            tenant.replicate_to_shard(using=target)
+            copied = self.copy(tenant, source, target, batch_size)
+            Tenant.objects.filter(pk=tenant.pk).update(shard=target)
+
+        removed = self.remove_copies(tenant, target, batch_size)
+        if source == target:
+            self.stdout.write(self.style.SUCCESS(
+                f"Tenant '{tenant.name}' is already on '{target}'; removed {removed} leftover row(s)."
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {copied} product(s) of '{tenant.name}' from '{source}' to '{target}'."
+        ))
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from task_api.imports import requeue_stale_import_jobs, run_import_job
+from task_api.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Process pending product import jobs in this process (e.g. jobs left over after a restart)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of jobs to process.")
+        parser.add_argument(
+            '--requeue-stale', action='store_true',
+            help="First return running jobs without progress for PRODUCT_IMPORT_STALE_AFTER to pending; "
+                 "they resume after the last recorded chunk."
+        )
+        parser.add_argument(
+            '--stale-minutes', type=int, default=None,
+            help="Override PRODUCT_IMPORT_STALE_AFTER for --requeue-stale."
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_stale']:
+            stale_after = None
+            if options['stale_minutes'] is not None:
+                stale_after = timedelta(minutes=options['stale_minutes'])
+            requeued = requeue_stale_import_jobs(stale_after)
+            self.stdout.write(f"Requeued {len(requeued)} stale import job(s).")
+        pending = ImportJob.objects.filter(status=ImportJob.STATUS_PENDING).order_by('created')
+        job_ids = list(pending.values_list('pk', flat=True)[:options['limit']])
+        for job_id in job_ids:
+            run_import_job(job_id)
+            job = ImportJob.objects.defer('source').get(pk=job_id)
+            self.stdout.write(
+                f"Import #{job.pk}: {job.status}, {job.created_rows} created, {job.failed_rows} failed"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(job_ids)} import job(s)."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from task_api.models import Tenant
+from task_api.purge import purge_deleted_products, purge_tenant
+
+
+class Command(BaseCommand):
+    help = "Remove soft-deleted products and finish purging soft-deleted tenants, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        tenant_ids = list(Tenant.all_objects.deleted().values_list('pk', flat=True))
+        for tenant_id in tenant_ids:
+            purge_tenant(tenant_id, batch_size)
+        deleted = purge_deleted_products(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {len(tenant_ids)} tenant(s) and {deleted} deleted product(s)."
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_api', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='shard',
+            field=models.CharField(default='default', help_text="Database alias holding this tenant's products.", max_length=100),
+        ),
+    ]
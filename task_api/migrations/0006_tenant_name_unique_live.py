@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_api', '0005_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tenant',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='tenant',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('name',), name='unique_live_tenant_name'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:48
+
+from django.conf import settings
+from django.db import connections, migrations, models
+from django.db.models import Max
+
+
+def seed_product_sequence(apps, schema_editor):
+    # Start after the highest product id on any database that already has
+    # products, so allocated ids never clash with existing rows.
+    Product = apps.get_model('task_api', 'Product')
+    IdSequence = apps.get_model('task_api', 'IdSequence')
+    highest = 0
+    for alias in settings.DATABASES:
+        if Product._meta.db_table in connections[alias].introspection.table_names():
+            highest = max(highest, Product.objects.using(alias).aggregate(value=Max('pk'))['value'] or 0)
+    IdSequence.objects.using(schema_editor.connection.alias).create(name='product', value=highest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_api', '0006_tenant_name_unique_live'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_product_sequence, migrations.RunPython.noop),
+    ]
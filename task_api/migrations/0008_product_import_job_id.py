@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_api', '0007_idsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='import_job_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_api', '0008_product_import_job_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='response_headers',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
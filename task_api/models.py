@@ -1,17 +1,132 @@
-from django.db import models
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
 from django.contrib.auth.models import AbstractUser
 from model_utils.models import TimeStampedModel
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def live(self):
+        return self.filter(deleted_at__isnull=True)
+
+    def deleted(self):
+        return self.filter(deleted_at__isnull=False)
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    Default manager hiding soft-deleted rows; use ``all_objects`` to see them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().live()
+
+
+class IdSequence(models.Model):
+    """
+    Counter handing out ids that are unique across every database, for
+    models whose rows are spread over shards. Always kept on the default
+    database.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, name, count=1):
+        """
+        Reserve ``count`` consecutive ids and return the first one.
+        """
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            sequences = cls.objects.using(DEFAULT_DB_ALIAS).filter(name=name)
+            if not sequences.update(value=models.F('value') + count):
+                cls.objects.using(DEFAULT_DB_ALIAS).get_or_create(name=name)
+                sequences.update(value=models.F('value') + count)
+            return sequences.values_list('value', flat=True).get() - count + 1
+
+    def __str__(self):
+        return f"{self.name} ({self.value})"
+
+
+class ProductQuerySet(SoftDeleteQuerySet):
+    """
+    Sends ``create()`` and ``bulk_create()`` without an explicit database to
+    the shard of the products' tenant, so code outside a request does not
+    write a sharded tenant's products to the default database.
+    """
+
+    def create(self, **kwargs):
+        if self._db is None:
+            alias = router.db_for_write(self.model, instance=self.model(**kwargs))
+            return self.using(alias).create(**kwargs)
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if self._db is None:
+            aliases = {router.db_for_write(self.model, instance=obj) for obj in objs}
+            if len(aliases) > 1:
+                raise ValueError("Cannot bulk_create() products of tenants on different databases.")
+            if aliases:
+                return self.using(aliases.pop()).bulk_create(objs, *args, **kwargs)
+        new = [obj for obj in objs if obj.pk is None]
+        if new:
+            first_id = IdSequence.allocate(self.model.ID_SEQUENCE, len(new))
+            for offset, obj in enumerate(new):
+                obj.pk = first_id + offset
+        return super().bulk_create(objs, *args, **kwargs)
 
 
 class Tenant(TimeStampedModel):
     """
     Represents a tenant or organization.
     """
-    name = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255)
     address = models.TextField(blank=True, null=True)
     contact = models.CharField(max_length=255, blank=True, null=True)
     location = models.CharField(max_length=255, blank=True, null=True)
+    shard = models.CharField(
+        max_length=100,
+        default=DEFAULT_DB_ALIAS,
+        help_text="Database alias holding this tenant's products."
+    )
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    class Meta:
+        # A deleted tenant frees its name while its data is being purged.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='unique_live_tenant_name'
+            )
+        ]
+
+    def clean(self):
+        if self.shard not in settings.DATABASES:
+            raise ValidationError({"shard": f"Unknown database '{self.shard}'."})
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self._state.db == DEFAULT_DB_ALIAS and self.shard != DEFAULT_DB_ALIAS:
+            self.replicate_to_shard()
+
+    def replicate_to_shard(self, using=None):
+        """
+        Copy this tenant row to its shard so products stored there can
+        reference it.
+        """
+        Tenant.all_objects.using(using or self.shard).update_or_create(
+            pk=self.pk,
+            defaults={
+                field.attname: getattr(self, field.attname)
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+            }
+        )
 
     def __str__(self):
         return self.name
@@ -57,23 +172,137 @@ class Product(TimeStampedModel):
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+    # Not a foreign key: jobs stay on the default database while products may
+    # live on a shard. Lets a resumed import recognise rows it already created.
+    import_job_id = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
+    objects = SoftDeleteManager.from_queryset(ProductQuerySet)()
+    all_objects = ProductQuerySet.as_manager()
+
+    # Ids come from a shared IdSequence instead of each database's own
+    # auto-increment, so products keep their ids when moved between shards.
+    ID_SEQUENCE = 'product'
 
     class Meta:
-        # Ensures uniqueness of product name per tenant
+        # Ensures uniqueness of product name per tenant among live products.
+        # Being partial, the index behind it also serves live-product lookups
+        # without carrying deleted rows.
         constraints = [
             models.UniqueConstraint(
                 fields=['tenant', 'name'],
+                condition=models.Q(deleted_at__isnull=True),
                 name='unique_product_per_tenant'
             )
         ]
-        
+        indexes = [
+            # Lets the purge find deleted rows without scanning live ones.
+            models.Index(
+                fields=['deleted_at'],
+                condition=models.Q(deleted_at__isnull=False),
+                name='product_deleted_at_idx'
+            )
+        ]
+
     def clean(self):
-        if Product.objects.filter(tenant=self.tenant, name=self.name).exclude(pk=self.pk).exists():
+        # Through the tenant, so the check runs on the tenant's shard.
+        if self.tenant.products.filter(name=self.name).exclude(pk=self.pk).exists():
             raise ValidationError({"name": f"Product with name '{self.name}' already exists for the tenant '{self.tenant.name}'."})
 
     def save(self, *args, **kwargs):
         self.clean()
+        if self.pk is None:
+            self.pk = IdSequence.allocate(self.ID_SEQUENCE)
         super().save(*args, **kwargs)
 
+    def soft_delete(self):
+        """
+        Hide the product; the row is removed later by the purge.
+        """
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
+
     def __str__(self):
         return f"{self.name} ({self.tenant.name})"
+
+
+class ImportJob(TimeStampedModel):
+    """
+    Background bulk import of products from an uploaded CSV/NDJSON file.
+    """
+    FORMAT_CSV = 'csv'
+    FORMAT_NDJSON = 'ndjson'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_NDJSON, 'NDJSON'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        related_name='import_jobs'
+    )
+    created_by = models.ForeignKey(
+        'task_api.User',
+        on_delete=models.SET_NULL,
+        related_name='import_jobs',
+        null=True,
+        blank=True
+    )
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    source = models.TextField()
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.tenant.name}, {self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The first response to a write made with an ``Idempotency-Key`` header,
+    replayed when the client retries with the same key.
+    """
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.TextField(blank=True)
+    response_headers = models.JSONField(default=dict, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tenant', 'key'],
+                name='unique_idempotency_key_per_tenant'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.tenant.name})"
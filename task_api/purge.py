@@ -0,0 +1,86 @@
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey, ImportJob, Product, Tenant, User
+from . import tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+def delete_in_batches(queryset, batch_size=None):
+    """
+    Delete the rows of ``queryset`` one bounded batch (and transaction) at a
+    time, so no single statement locks or holds a large number of rows.
+    """
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    using = queryset.db
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        with transaction.atomic(using=using):
+            queryset.model._base_manager.using(using).filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def soft_delete_tenant(tenant):
+    """
+    Hide ``tenant``, lock its users out and schedule the background purge of
+    its data, in a fixed number of statements however much data it owns.
+
+    Deactivated users are rejected by authentication straight away; their
+    cached logins and tokens are dropped when the purge deletes them.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        Tenant.all_objects.filter(pk=tenant.pk).update(deleted_at=now, modified=now)
+        if tenant.shard != DEFAULT_DB_ALIAS:
+            # The shard copy must free the name as well, for tenants moved there later.
+            Tenant.all_objects.using(tenant.shard).filter(pk=tenant.pk).update(deleted_at=now, modified=now)
+        User.objects.filter(tenant=tenant).update(is_active=False)
+    tenant.deleted_at = now
+
+    transaction.on_commit(lambda: tasks.submit(purge_tenant, tenant.pk))
+
+
+def purge_tenant(tenant_id, batch_size=None):
+    """
+    Remove a soft-deleted tenant and everything it owns in bounded batches.
+    """
+    tenant = Tenant.all_objects.filter(pk=tenant_id, deleted_at__isnull=False).first()
+    if tenant is None:
+        return
+
+    shards = {tenant.shard, DEFAULT_DB_ALIAS}
+    for using in shards:
+        delete_in_batches(Product.all_objects.using(using).filter(tenant_id=tenant_id), batch_size)
+    delete_in_batches(ImportJob.objects.filter(tenant_id=tenant_id), batch_size)
+    delete_in_batches(IdempotencyKey.objects.filter(tenant_id=tenant_id), batch_size)
+    # Deleting users through the ORM sends the signals that drop their
+    # cached logins and revoke their tokens.
+    delete_in_batches(User.objects.filter(tenant_id=tenant_id), batch_size)
+
+    for using in shards - {DEFAULT_DB_ALIAS}:
+        Tenant.all_objects.using(using).filter(pk=tenant_id).delete()
+    tenant.delete()
+    logger.info("Purged tenant %s", tenant_id)
+
+
+def purge_deleted_products(batch_size=None):
+    """
+    Remove products soft-deleted more than ``SOFT_DELETE_RETENTION`` ago,
+    on every database.
+    """
+    cutoff = timezone.now() - settings.SOFT_DELETE_RETENTION
+    deleted = 0
+    for using in settings.DATABASES:
+        deleted += delete_in_batches(
+            Product.all_objects.using(using).filter(deleted_at__lte=cutoff),
+            batch_size
+        )
+    return deleted
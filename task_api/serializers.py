@@ -1,5 +1,29 @@
-from rest_framework import serializers
-from .models import Product
+from decimal import Decimal
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import DecimalValidator
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import DecimalField, F, Manager, Q, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import ImportJob, Product
+from .tokens import (
+    TenantRefreshToken,
+    cache_user,
+    check_cached_password,
+    get_cached_user,
+    is_revoked,
+    revoke_token,
+)
 
 
 
@@ -14,6 +38,62 @@ class ProductWriteSerializer(serializers.ModelSerializer):
         fields = ['name', 'description', 'price', 'quantity']
 
 
+class ProductReadListSerializer(serializers.ListSerializer):
+    """
+    Builds product list rows straight from model attributes. Dispatching
+    through every field's ``to_representation`` (and the per-value timezone
+    lookup of ``DateTimeField``) dominates the cost of large product lists, so
+    the encoding done by the child's fields is inlined here.
+    """
+    price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+    datetime_field = serializers.DateTimeField()
+
+    def get_price_encoder(self):
+        if not api_settings.COERCE_DECIMAL_TO_STRING:
+            return self.price_field.to_representation
+        cents = Decimal('0.01')
+        return lambda value: '{:f}'.format(value.quantize(cents))
+
+    def get_datetime_encoder(self):
+        if not settings.USE_TZ or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+            return self.datetime_field.to_representation
+        current_timezone = timezone.get_current_timezone()
+
+        def encode(value):
+            value = value.astimezone(current_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return encode
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        price = self.get_price_encoder()
+        datetime = self.get_datetime_encoder()
+        tenant_names = {}
+
+        def tenant_name(product):
+            # Rows of a page share one tenant; fetch its name once.
+            if product.tenant_id not in tenant_names:
+                tenant_names[product.tenant_id] = product.tenant.name
+            return tenant_names[product.tenant_id]
+
+        # Keep in sync with ProductReadSerializer.Meta.fields.
+        return [
+            {
+                'id': product.id,
+                'tenant': tenant_name(product),
+                'name': product.name,
+                'description': product.description,
+                'price': price(product.price),
+                'quantity': product.quantity,
+                'created': datetime(product.created),
+                'modified': datetime(product.modified),
+            }
+            for product in iterable
+        ]
+
+
 class ProductReadSerializer(serializers.ModelSerializer):
     """
     Serializer for reading Product objects.
@@ -22,6 +102,7 @@ class ProductReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
+        list_serializer_class = ProductReadListSerializer
         fields = [
             'id',
             'tenant',
@@ -36,3 +117,262 @@ class ProductReadSerializer(serializers.ModelSerializer):
 
     def get_tenant(self, obj):
         return obj.tenant.name if obj.tenant else None
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for reading the status and progress of an ImportJob.
+    """
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id',
+            'format',
+            'status',
+            'total_rows',
+            'processed_rows',
+            'created_rows',
+            'failed_rows',
+            'errors',
+            'started_at',
+            'finished_at',
+            'created',
+            'modified',
+        ]
+        read_only_fields = fields
+
+
+class ImportJobCreateSerializer(serializers.Serializer):
+    """
+    Serializer for uploading a CSV/NDJSON file to import products from.
+    """
+    EXTENSION_FORMATS = {
+        '.csv': ImportJob.FORMAT_CSV,
+        '.ndjson': ImportJob.FORMAT_NDJSON,
+        '.jsonl': ImportJob.FORMAT_NDJSON,
+    }
+
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=ImportJob.FORMAT_CHOICES, required=False)
+
+    def validate(self, attrs):
+        upload = attrs['file']
+        if 'format' not in attrs:
+            extension = os.path.splitext(upload.name)[1].lower()
+            if extension not in self.EXTENSION_FORMATS:
+                raise serializers.ValidationError(
+                    {"format": "Could not infer the file format; specify 'csv' or 'ndjson'."}
+                )
+            attrs['format'] = self.EXTENSION_FORMATS[extension]
+        try:
+            attrs['source'] = upload.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise serializers.ValidationError({"file": "The file must be UTF-8 encoded."})
+        return attrs
+
+
+class ProductBulkFilterSerializer(serializers.Serializer):
+    """
+    Criteria selecting the products a bulk update applies to.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    name_prefix = serializers.CharField(required=False)
+    name_contains = serializers.CharField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    LOOKUPS = {
+        'ids': 'pk__in',
+        'name_prefix': 'name__startswith',
+        'name_contains': 'name__contains',
+        'min_price': 'price__gte',
+        'max_price': 'price__lte',
+    }
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("At least one filter criterion is required.")
+        return attrs
+
+
+def _price_limit():
+    price = Product._meta.get_field('price')
+    return Decimal(10) ** (price.max_digits - price.decimal_places) - Decimal(1).scaleb(-price.decimal_places)
+
+
+# The range every backend can store in a PositiveIntegerField.
+QUANTITY_MAX = BaseDatabaseOperations.integer_field_ranges['PositiveIntegerField'][1]
+
+# Output field of the ``1 + percent / 100`` factor a percent change multiplies by.
+PERCENT_FACTOR_FIELD = DecimalField(max_digits=12, decimal_places=6)
+
+
+class PriceUpdateSerializer(serializers.Serializer):
+    OPS = ['set', 'percent', 'delta']
+    # Keeps the factor within PERCENT_FACTOR_FIELD; any larger increase
+    # would overflow the price column anyway.
+    MAX_PERCENT = Decimal(1000000)
+
+    op = serializers.ChoiceField(choices=OPS)
+    value = serializers.DecimalField(max_digits=12, decimal_places=4)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'set' and attrs['value'] < 0:
+            raise serializers.ValidationError({"value": "Price cannot be negative."})
+        if attrs['op'] == 'percent' and attrs['value'] <= -100:
+            raise serializers.ValidationError({"value": "Percentage change must be greater than -100."})
+        if attrs['op'] == 'percent' and attrs['value'] > self.MAX_PERCENT:
+            raise serializers.ValidationError(
+                {"value": f"Percentage change must be at most {self.MAX_PERCENT}."}
+            )
+        if attrs['op'] in ('set', 'delta'):
+            # Amounts are stored as-is, so they must fit the price column.
+            price = Product._meta.get_field('price')
+            try:
+                DecimalValidator(price.max_digits, price.decimal_places)(attrs['value'].normalize())
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({"value": exc.messages})
+        return attrs
+
+
+class QuantityUpdateSerializer(serializers.Serializer):
+    OPS = ['set', 'delta']
+
+    op = serializers.ChoiceField(choices=OPS)
+    value = serializers.IntegerField(min_value=-QUANTITY_MAX, max_value=QUANTITY_MAX)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'set' and attrs['value'] < 0:
+            raise serializers.ValidationError({"value": "Quantity cannot be negative."})
+        return attrs
+
+
+class DescriptionUpdateSerializer(serializers.Serializer):
+    OPS = ['set']
+
+    op = serializers.ChoiceField(choices=OPS)
+    value = serializers.CharField(allow_blank=True, allow_null=True)
+
+
+class ProductBulkChangesSerializer(serializers.Serializer):
+    """
+    Field changes applied by a bulk update.
+    """
+    price = PriceUpdateSerializer(required=False)
+    quantity = QuantityUpdateSerializer(required=False)
+    description = DescriptionUpdateSerializer(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("At least one field change is required.")
+        return attrs
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """
+    Serializer for applying one change set to every matching product.
+    """
+    filter = ProductBulkFilterSerializer()
+    update = ProductBulkChangesSerializer()
+
+    def get_filter_kwargs(self):
+        return {
+            ProductBulkFilterSerializer.LOOKUPS[key]: value
+            for key, value in self.validated_data['filter'].items()
+        }
+
+    def get_update_kwargs(self):
+        """
+        Translate the requested changes into ``QuerySet.update()`` arguments
+        evaluated by the database.
+        """
+        kwargs = {}
+        for field, change in self.validated_data['update'].items():
+            op, value = change['op'], change['value']
+            if op == 'set':
+                kwargs[field] = value
+            elif op == 'delta':
+                kwargs[field] = F(field) + value
+            elif op == 'percent':
+                factor = Value(1 + value / Decimal(100), output_field=PERCENT_FACTOR_FIELD)
+                kwargs[field] = Round(F(field) * factor, 2)
+        return kwargs
+
+    def has_out_of_range_values(self, queryset, changes):
+        """
+        Whether the new price or quantity of any product in ``queryset`` would
+        be negative or too large for its column. Not every backend rejects
+        these itself: SQLite stores them and later reads of the row fail.
+        """
+        limits = {'price': _price_limit(), 'quantity': QUANTITY_MAX}
+        out_of_range = Q()
+        aliases = {}
+        for field, limit in limits.items():
+            change = self.validated_data['update'].get(field)
+            # Values that are set directly were validated by their serializer.
+            if change is None or change['op'] == 'set':
+                continue
+            aliases[f'new_{field}'] = changes[field]
+            out_of_range |= Q(**{f'new_{field}__lt': 0}) | Q(**{f'new_{field}__gt': limit})
+        if not aliases:
+            return False
+        return queryset.alias(**aliases).filter(out_of_range).exists()
+
+
+class CachedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues token pairs, checking the password against a cached copy of the
+    user so repeated logins skip the user and tenant queries.
+    """
+    token_class = TenantRefreshToken
+
+    def validate(self, attrs):
+        user = get_cached_user(attrs[self.username_field])
+        if user is None:
+            data = super().validate(attrs)
+            cache_user(self.user, attrs['password'])
+            return data
+
+        valid, hashed = check_cached_password(user, attrs['password'])
+        if not (valid and jwt_settings.USER_AUTHENTICATION_RULE(user)):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        if hashed and settings.LOGIN_CACHE_VERIFIED_CREDENTIALS:
+            cache_user(user, attrs['password'])
+
+        self.user = user
+        refresh = self.get_token(user)
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes access tokens from the refresh token alone, rejecting tokens
+    on the cached revocation list.
+    """
+    token_class = TenantRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_revoked(refresh):
+            raise TokenError("Token has been revoked")
+
+        data = {"access": str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            revoke_token(refresh)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    """
+    Serializer for revoking (logging out) a refresh token.
+    """
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        revoke_token(TenantRefreshToken(attrs['refresh']))
+        return {}
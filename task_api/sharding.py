@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Database alias of the tenant whose request or job is being handled.
+_current_shard = ContextVar('current_shard', default=None)
+
+
+def get_current_shard():
+    return _current_shard.get()
+
+
+def activate_tenant(tenant):
+    """
+    Route sharded queries in the current context to ``tenant``'s database.
+    Returns a token for ``deactivate_tenant``.
+    """
+    return _current_shard.set(tenant.shard if tenant is not None else None)
+
+
+def deactivate_tenant(token):
+    _current_shard.reset(token)
+
+
+@contextmanager
+def use_tenant_shard(tenant):
+    token = activate_tenant(tenant)
+    try:
+        yield
+    finally:
+        deactivate_tenant(token)
+
+
+class TenantShardRouter:
+    """
+    Sends tenant-owned models to the tenant's shard and everything else
+    (tenants, users, auth, jobs) to the default database.
+
+    The shard is taken from the instance being saved or traversed when there
+    is one (an unsaved product goes to its tenant's shard), otherwise from the
+    tenant activated for the current request/job.
+    Every database carries the full schema; shards hold a replica of the
+    tenant rows so foreign keys to ``Tenant`` stay valid.
+    """
+    sharded_models = {
+        ('task_api', 'product'),
+    }
+
+    def is_sharded(self, model):
+        return (model._meta.app_label, model._meta.model_name) in self.sharded_models
+
+    def _db_for_model(self, model, **hints):
+        if not self.is_sharded(model):
+            return DEFAULT_DB_ALIAS
+
+        instance = hints.get('instance')
+        if instance is not None:
+            if isinstance(instance, model):
+                if instance._state.db:
+                    return instance._state.db
+                if instance.tenant_id is not None:
+                    # Loads the tenant from the default database if needed.
+                    return instance.tenant.shard
+            elif hasattr(instance, 'shard'):
+                # Reverse relation from a Tenant, e.g. ``tenant.products``.
+                return instance.shard
+
+        return get_current_shard() or DEFAULT_DB_ALIAS
+
+    db_for_read = _db_for_model
+    db_for_write = _db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.is_sharded(type(obj1)) or self.is_sharded(type(obj2)):
+            return True
+        return None
@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .events import broker
+from .models import Product, User
+from .serializers import ProductReadSerializer
+from .tokens import invalidate_cached_user, revoke_user_tokens
+
+
+# Sent after a set-based update changed products without calling save(), so
+# post_save receivers (and any caches keyed on products) do not see it.
+# Arguments: ``tenant``, ``filters`` (the lookup kwargs), ``fields`` and ``count``.
+products_bulk_updated = Signal()
+
+# Sent after products were inserted with bulk_create(), which skips post_save.
+# Arguments: ``tenant`` and ``count``.
+products_bulk_created = Signal()
+
+# Set while rows are removed from a database they were copied away from, so
+# the products are not announced as deleted.
+_muted_product_events = ContextVar('muted_product_events', default=False)
+
+
+@contextmanager
+def mute_product_events():
+    token = _muted_product_events.set(True)
+    try:
+        yield
+    finally:
+        _muted_product_events.reset(token)
+
+
+@receiver(post_save, sender=Product)
+def publish_product_saved(sender, instance, created, using, **kwargs):
+    if instance.deleted_at is not None:
+        event_type, data = 'product.deleted', {'id': instance.pk}
+    else:
+        event_type = 'product.created' if created else 'product.updated'
+        data = ProductReadSerializer(instance).data
+    transaction.on_commit(lambda: broker.publish(instance.tenant_id, event_type, data), using=using)
+
+
+@receiver(post_delete, sender=Product)
+def publish_product_deleted(sender, instance, using, **kwargs):
+    if instance.deleted_at is not None or _muted_product_events.get():
+        # Already announced when it was soft-deleted, or only moved to another database.
+        return
+    data = {'id': instance.pk}
+    transaction.on_commit(lambda: broker.publish(instance.tenant_id, 'product.deleted', data), using=using)
+
+
+@receiver(products_bulk_updated)
+def publish_products_bulk_updated(sender, tenant, fields, count, **kwargs):
+    broker.publish(tenant.pk, 'products.bulk_updated', {'fields': fields, 'count': count})
+
+
+@receiver(products_bulk_created)
+def publish_products_bulk_created(sender, tenant, count, **kwargs):
+    broker.publish(tenant.pk, 'products.bulk_created', {'count': count})
+
+
+@receiver(post_save, sender=User)
+def refresh_cached_login(sender, instance, created, **kwargs):
+    invalidate_cached_user(instance.get_username())
+    # ``_password`` holds the new raw password until save() finishes.
+    if not created and (instance._password is not None or not instance.is_active):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    invalidate_cached_user(instance.get_username())
+    revoke_user_tokens(instance.pk)
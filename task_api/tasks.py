@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the process-wide worker pool used for background jobs.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='task_api-worker'
+            )
+        return _executor
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(func, '__name__', func))
+    finally:
+        # Worker threads own their connections; release them between tasks.
+        connections.close_all()
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run ``func`` in the background worker pool.
+
+    When ``BACKGROUND_TASKS_ASYNC`` is disabled (e.g. in tests) the task runs
+    inline in the calling thread instead.
+    """
+    if not settings.BACKGROUND_TASKS_ASYNC:
+        func(*args, **kwargs)
+        return None
+    return get_executor().submit(_run, func, args, kwargs)
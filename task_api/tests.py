@@ -1,10 +1,34 @@
+import asyncio
+import threading
+import gzip
+import json
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock, skipUnless
+
 from rest_framework.test import APITestCase
-from django.test import TestCase
-from django.db import IntegrityError
+from django.conf import settings
+from django.core.management import call_command
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.utils import timezone
+from django.db import IntegrityError, connections, router
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from .models import Tenant, Product
+from .purge import purge_deleted_products, soft_delete_tenant
+from .events import ProductEventBroker, RESET_EVENT, broker
+from .models import IdempotencyKey, ImportJob, Tenant, Product
+from .serializers import ProductReadSerializer
+from .sharding import use_tenant_shard
+from .signals import products_bulk_updated
+from .tokens import get_cached_user
+from .views import ProductListCreateAPIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
 User = get_user_model()
@@ -14,8 +38,9 @@ User = get_user_model()
 User = get_user_model()
 
 class TenantModelTest(TestCase):
-    def setUp(self):
-        self.tenant = Tenant.objects.create(name="Tenant A", address="123 Street", contact="123456789", location="City A")
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name="Tenant A", address="123 Street", contact="123456789", location="City A")
 
     def test_create_tenant(self):
         tenant_count = Tenant.objects.count()
@@ -31,10 +56,11 @@ class TenantModelTest(TestCase):
             Tenant.objects.create(name="Tenant A")
 
 class UserModelTest(TestCase):
-    def setUp(self):
-        self.tenant = Tenant.objects.create(name="Tenant B")
-        self.superuser = User.objects.create_superuser(username="admin", email="admin@example.com", password="password123")
-        self.tenant_user = User.objects.create_user(username="user1", email="user1@example.com", password="password123", tenant=self.tenant)
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name="Tenant B")
+        cls.superuser = User.objects.create_superuser(username="admin", email="admin@example.com", password="password123")
+        cls.tenant_user = User.objects.create_user(username="user1", email="user1@example.com", password="password123", tenant=cls.tenant)
 
     def test_create_user_with_tenant(self):
         self.assertEqual(self.tenant_user.tenant, self.tenant)
@@ -58,11 +84,12 @@ class UserModelTest(TestCase):
             
 
 class ProductModelTest(TestCase):
-    def setUp(self):
-        self.tenant = Tenant.objects.create(name="Tenant C")
-        self.user = User.objects.create_user(username="user2", email="user2@example.com", password="password123", tenant=self.tenant)
-        self.product = Product.objects.create(
-            tenant=self.tenant,
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name="Tenant C")
+        cls.user = User.objects.create_user(username="user2", email="user2@example.com", password="password123", tenant=cls.tenant)
+        cls.product = Product.objects.create(
+            tenant=cls.tenant,
             name="Product A",
             description="A sample product",
             price=10.99,
@@ -107,11 +134,12 @@ class ProductModelTest(TestCase):
         
 
 class RelationshipsTest(TestCase):
-    def setUp(self):
-        self.tenant = Tenant.objects.create(name="Tenant E")
-        self.user = User.objects.create_user(username="user3", email="user3@example.com", password="password123", tenant=self.tenant)
-        self.product = Product.objects.create(
-            tenant=self.tenant,
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name="Tenant E")
+        cls.user = User.objects.create_user(username="user3", email="user3@example.com", password="password123", tenant=cls.tenant)
+        cls.product = Product.objects.create(
+            tenant=cls.tenant,
             name="Product B",
             description="Another sample product",
             price=12.99,
@@ -132,38 +160,60 @@ class RelationshipsTest(TestCase):
 
 
 
-class APITestCaseSetup(APITestCase):
-    def setUp(self):
+class QueryBudgetMixin:
+    """
+    Query-count assertions that fail with the offending SQL, so a request
+    that starts issuing extra queries is caught like any other regression.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > budget:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            self.fail(f"{len(context)} queries executed on '{using}', budget is {budget}:\n{queries}")
+
+    def assertEndpointQueries(self, budget, method, path, data=None, expected_status=status.HTTP_200_OK, **extra):
+        with self.assertMaxQueries(budget):
+            response = getattr(self.client, method)(path, data, **extra)
+        self.assertEqual(response.status_code, expected_status, getattr(response, 'data', None))
+        return response
+
+
+class APITestCaseSetup(QueryBudgetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
         # Create Tenants
-        self.tenant1 = Tenant.objects.create(name="Tenant 1")
-        self.tenant2 = Tenant.objects.create(name="Tenant 2")
+        cls.tenant1 = Tenant.objects.create(name="Tenant 1")
+        cls.tenant2 = Tenant.objects.create(name="Tenant 2")
 
         # Create Users
-        self.user_tenant1 = User.objects.create_user(
+        cls.user_tenant1 = User.objects.create_user(
             username="user1",
             password="password123",
-            tenant=self.tenant1
+            tenant=cls.tenant1
         )
-        self.user_tenant2 = User.objects.create_user(
+        cls.user_tenant2 = User.objects.create_user(
             username="user2",
             password="password123",
-            tenant=self.tenant2
+            tenant=cls.tenant2
         )
 
         # Create Products
-        self.product1 = Product.objects.create(
-            tenant=self.tenant1, name="Product 1", description="Description 1", price=10.00, quantity=100
+        cls.product1 = Product.objects.create(
+            tenant=cls.tenant1, name="Product 1", description="Description 1", price=10.00, quantity=100
         )
-        self.product2 = Product.objects.create(
-            tenant=self.tenant2, name="Product 2", description="Description 2", price=20.00, quantity=200
+        cls.product2 = Product.objects.create(
+            tenant=cls.tenant2, name="Product 2", description="Description 2", price=20.00, quantity=200
         )
 
         # Obtain Tokens
-        self.token_user1 = RefreshToken.for_user(self.user_tenant1).access_token
-        self.token_user2 = RefreshToken.for_user(self.user_tenant2).access_token
+        cls.token_user1 = str(RefreshToken.for_user(cls.user_tenant1).access_token)
+        cls.token_user2 = str(RefreshToken.for_user(cls.user_tenant2).access_token)
 
-        self.auth_header_user1 = {'HTTP_AUTHORIZATION': f'Bearer {self.token_user1}'}
-        self.auth_header_user2 = {'HTTP_AUTHORIZATION': f'Bearer {self.token_user2}'}
+        cls.auth_header_user1 = {'HTTP_AUTHORIZATION': f'Bearer {cls.token_user1}'}
+        cls.auth_header_user2 = {'HTTP_AUTHORIZATION': f'Bearer {cls.token_user2}'}
 
 
 class AuthenticationFlowTest(APITestCaseSetup):
@@ -254,3 +304,786 @@ class ProductCRUDTest(APITestCaseSetup):
             "quantity": 30
         })
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False, PRODUCT_IMPORT_CHUNK_SIZE=2)
+class ProductImportTest(APITestCaseSetup):
+    def upload(self, name, content, **extra):
+        data = {'file': SimpleUploadedFile(name, content.encode('utf-8'))}
+        data.update(extra)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/products/imports/', data, format='multipart', **self.auth_header_user1)
+
+    def test_import_csv(self):
+        content = (
+            "name,description,price,quantity\n"
+            "Widget,A widget,1.50,10\n"
+            "Gadget,,2.00,5\n"
+            "Gizmo,A gizmo,3.25,7\n"
+        )
+        response = self.upload('products.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], ImportJob.STATUS_PENDING)
+
+        response = self.client.get(f"/api/products/imports/{response.data['id']}/", **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], ImportJob.STATUS_SUCCEEDED)
+        self.assertEqual(response.data['total_rows'], 3)
+        self.assertEqual(response.data['processed_rows'], 3)
+        self.assertEqual(response.data['created_rows'], 3)
+        self.assertEqual(response.data['failed_rows'], 0)
+        self.assertEqual(Product.objects.filter(tenant=self.tenant1).count(), 4)
+
+    def test_import_ndjson_records_row_errors(self):
+        content = (
+            '{"name": "Widget", "price": "1.50", "quantity": 10}\n'
+            '{"name": "Product 1", "price": "1.00", "quantity": 1}\n'
+            '{"name": "Broken", "price": "abc", "quantity": 1}\n'
+            'not json\n'
+            '{"name": "Widget", "price": "1.50", "quantity": 10}\n'
+        )
+        response = self.upload('products.txt', content, format='ndjson')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job = ImportJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, ImportJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.processed_rows, 5)
+        self.assertEqual(job.created_rows, 1)
+        self.assertEqual(job.failed_rows, 4)
+        self.assertEqual([error['row'] for error in job.errors], [2, 3, 4, 5])
+        self.assertIn("Product with name 'Product 1' already exists", job.errors[0]['errors']['name'][0])
+        self.assertIn('price', job.errors[1]['errors'])
+
+    def test_stale_running_job_is_requeued_and_resumed(self):
+        job = ImportJob.objects.create(
+            tenant=self.tenant1,
+            format=ImportJob.FORMAT_CSV,
+            source="name,price,quantity\nDone A,1.00,1\nDone B,1.00,1\nLeft,1.00,1\n",
+            status=ImportJob.STATUS_RUNNING,
+            processed_rows=1,
+            created_rows=1,
+        )
+        # Row 2 was committed by the interrupted pass but not recorded as processed.
+        Product.objects.create(tenant=self.tenant1, name="Done B", price=1, quantity=1, import_job_id=job.pk)
+        fresh = ImportJob.objects.create(
+            tenant=self.tenant1, format=ImportJob.FORMAT_CSV, source="name,price,quantity\n",
+            status=ImportJob.STATUS_RUNNING
+        )
+        ImportJob.objects.filter(pk=job.pk).update(modified=timezone.now() - settings.PRODUCT_IMPORT_STALE_AFTER * 2)
+
+        with self.assertLogs('task_api.imports', 'WARNING') as logs:
+            call_command('process_import_jobs', '--requeue-stale', stdout=StringIO())
+        self.assertEqual(logs.output, [f"WARNING:task_api.imports:Requeued stale import jobs [{job.pk}]"])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_SUCCEEDED)
+        self.assertEqual((job.processed_rows, job.created_rows, job.failed_rows), (3, 3, 0))
+        self.assertEqual(
+            set(Product.objects.filter(name__in=["Done A", "Done B", "Left"]).values_list('name', flat=True)),
+            {"Done B", "Left"}
+        )
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, ImportJob.STATUS_RUNNING)
+
+    def test_zero_stale_minutes_requeues_every_running_job(self):
+        job = ImportJob.objects.create(
+            tenant=self.tenant1, format=ImportJob.FORMAT_CSV, source="name,price,quantity\n",
+            status=ImportJob.STATUS_RUNNING
+        )
+        with self.assertLogs('task_api.imports', 'WARNING'):
+            call_command('process_import_jobs', '--requeue-stale', '--stale-minutes', '0', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_SUCCEEDED)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.upload('products.xlsx', 'name\n')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('format', response.data)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_import_job_tenant_isolation(self):
+        response = self.upload('products.csv', "name,price,quantity\nWidget,1.00,1\n")
+        job_id = response.data['id']
+
+        response = self.client.get(f'/api/products/imports/{job_id}/', **self.auth_header_user2)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/products/imports/', **self.auth_header_user2)
+        self.assertEqual(len(response.data), 0)
+        self.assertFalse(Product.objects.filter(tenant=self.tenant2, name="Widget").exists())
+
+
+class ProductBulkUpdateTest(APITestCaseSetup):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.widget = Product.objects.create(tenant=cls.tenant1, name="Widget A", price=100.00, quantity=10)
+        cls.other_widget = Product.objects.create(tenant=cls.tenant2, name="Widget B", price=100.00, quantity=10)
+
+    def bulk_update(self, data, auth_header=None):
+        return self.client.post('/api/products/bulk-update/', data, format='json', **(auth_header or self.auth_header_user1))
+
+    def test_percentage_price_change(self):
+        previous_modified = self.widget.modified
+        response = self.bulk_update({
+            "filter": {"name_prefix": "Widget"},
+            "update": {"price": {"op": "percent", "value": "5"}}
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"updated": 1})
+
+        self.widget.refresh_from_db()
+        self.other_widget.refresh_from_db()
+        self.assertEqual(str(self.widget.price), "105.00")
+        self.assertGreater(self.widget.modified, previous_modified)
+        self.assertEqual(str(self.other_widget.price), "100.00")
+
+    def test_set_and_delta_changes(self):
+        response = self.bulk_update({
+            "filter": {"ids": [self.product1.id, self.widget.id, self.other_widget.id]},
+            "update": {
+                "price": {"op": "set", "value": "9.99"},
+                "quantity": {"op": "delta", "value": -5},
+                "description": {"op": "set", "value": "Clearance"}
+            }
+        })
+        self.assertEqual(response.data, {"updated": 2})
+        self.widget.refresh_from_db()
+        self.assertEqual(str(self.widget.price), "9.99")
+        self.assertEqual(self.widget.quantity, 5)
+        self.assertEqual(self.widget.description, "Clearance")
+        self.other_widget.refresh_from_db()
+        self.assertEqual(self.other_widget.quantity, 10)
+
+    def test_negative_quantity_is_rejected(self):
+        response = self.bulk_update({
+            "filter": {"name_prefix": "Widget"},
+            "update": {"quantity": {"op": "delta", "value": -50}}
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.widget.refresh_from_db()
+        self.assertEqual(self.widget.quantity, 10)
+
+    def test_price_overflow_is_rejected(self):
+        Product.objects.filter(pk=self.widget.pk).update(price=99999999)
+        response = self.bulk_update({
+            "filter": {"name_prefix": "Widget"},
+            "update": {"price": {"op": "percent", "value": "50"}}
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.widget.refresh_from_db()
+        self.assertEqual(str(self.widget.price), "99999999.00")
+        response = self.client.get('/api/products/', **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        Product.objects.filter(pk=self.widget.pk).update(price=100)
+        response = self.bulk_update({
+            "filter": {"name_prefix": "Widget"},
+            "update": {"price": {"op": "delta", "value": "-100.01"}}
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_oversized_changes_are_rejected(self):
+        payloads = [
+            {"quantity": {"op": "set", "value": 100000000000000000000}},
+            {"quantity": {"op": "delta", "value": 100000000000000000000}},
+            {"price": {"op": "percent", "value": "99999999"}},
+        ]
+        for update in payloads:
+            response = self.bulk_update({"filter": {"name_prefix": "Widget"}, "update": update})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, update)
+
+    def test_quantity_overflow_is_rejected(self):
+        Product.objects.filter(pk=self.widget.pk).update(quantity=2147483647)
+        response = self.bulk_update({
+            "filter": {"name_prefix": "Widget"},
+            "update": {"quantity": {"op": "delta", "value": 1}}
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.widget.refresh_from_db()
+        self.assertEqual(self.widget.quantity, 2147483647)
+
+    def test_set_price_must_fit_the_column(self):
+        for value in ["100000000", "1.005"]:
+            response = self.bulk_update({
+                "filter": {"name_prefix": "Widget"},
+                "update": {"price": {"op": "set", "value": value}}
+            })
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_and_update_are_required(self):
+        response = self.bulk_update({"filter": {}, "update": {}})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('filter', response.data)
+        self.assertIn('update', response.data)
+
+        response = self.bulk_update({
+            "filter": {"name_prefix": "Widget"},
+            "update": {"quantity": {"op": "percent", "value": 5}}
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_signal(self):
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append(kwargs)
+
+        products_bulk_updated.connect(receiver)
+        self.addCleanup(products_bulk_updated.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bulk_update({
+                "filter": {"name_prefix": "Widget"},
+                "update": {"quantity": {"op": "set", "value": 1}}
+            })
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['tenant'], self.tenant1)
+        self.assertEqual(received[0]['fields'], ['quantity'])
+        self.assertEqual(received[0]['count'], 1)
+
+
+class TenantShardRouterTest(SimpleTestCase):
+    def test_sharded_models_follow_active_tenant(self):
+        tenant = Tenant(name="Sharded", shard="shard1")
+        self.assertEqual(router.db_for_read(Product), "default")
+        with use_tenant_shard(tenant):
+            self.assertEqual(router.db_for_read(Product), "shard1")
+            self.assertEqual(router.db_for_write(Product), "shard1")
+            self.assertEqual(router.db_for_read(Tenant), "default")
+            self.assertEqual(router.db_for_read(User), "default")
+        self.assertEqual(router.db_for_write(Product), "default")
+
+    def test_instance_hints(self):
+        tenant = Tenant(name="Sharded", shard="shard1")
+        self.assertEqual(router.db_for_write(Product, instance=Product(tenant=tenant)), "shard1")
+        self.assertEqual(router.db_for_read(Product, instance=tenant), "shard1")
+
+
+@skipUnless('shard1' in settings.DATABASES, "requires a 'shard1' database")
+class TenantShardingTest(APITestCaseSetup):
+    # The runner sets up databases of skipped classes too, so only ask for configured ones.
+    databases = {'default'} | ({'shard1'} & set(settings.DATABASES))
+
+    def test_move_tenant_and_route_requests(self):
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            call_command('move_tenant_shard', str(self.tenant1.pk), 'shard1', stdout=StringIO())
+        publish.assert_not_called()
+        self.tenant1.refresh_from_db()
+        self.assertEqual(self.tenant1.shard, 'shard1')
+        self.assertFalse(Product.objects.using('default').filter(tenant=self.tenant1).exists())
+        self.assertTrue(Product.objects.using('shard1').filter(pk=self.product1.pk).exists())
+
+        response = self.client.get('/api/products/', **self.auth_header_user1)
+        self.assertEqual([product['name'] for product in response.data], ["Product 1"])
+
+        data = {"name": "Sharded Product", "price": 1.00, "quantity": 1}
+        response = self.client.post('/api/products/', data, **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Product.objects.using('shard1').filter(name="Sharded Product").exists())
+        self.assertFalse(Product.objects.using('default').filter(name="Sharded Product").exists())
+
+        response = self.client.get('/api/products/', **self.auth_header_user2)
+        self.assertEqual([product['name'] for product in response.data], ["Product 2"])
+
+    def test_several_tenants_move_to_the_same_shard(self):
+        call_command('move_tenant_shard', str(self.tenant1.pk), 'shard1', stdout=StringIO())
+        self.tenant1.refresh_from_db()
+        Product.objects.create(tenant=self.tenant1, name="After Move", price=1, quantity=1)
+
+        call_command('move_tenant_shard', str(self.tenant2.pk), 'shard1', stdout=StringIO())
+        self.assertEqual(Product.objects.using('shard1').count(), 3)
+        self.assertFalse(Product.objects.using('default').exists())
+
+    def test_interrupted_move_can_be_rerun(self):
+        # A run that failed after copying, before switching the tenant.
+        self.tenant1.replicate_to_shard(using='shard1')
+        Product.all_objects.using('shard1').bulk_create([Product.objects.get(pk=self.product1.pk)])
+        call_command('move_tenant_shard', str(self.tenant1.pk), 'shard1', stdout=StringIO())
+        self.assertEqual(Product.objects.using('shard1').filter(tenant=self.tenant1).count(), 1)
+        self.assertFalse(Product.objects.using('default').filter(tenant=self.tenant1).exists())
+
+        # A run that failed after switching, before removing the old copies.
+        Product.all_objects.using('default').bulk_create([Product.objects.using('shard1').get(pk=self.product1.pk)])
+        out = StringIO()
+        call_command('move_tenant_shard', str(self.tenant1.pk), 'shard1', stdout=out)
+        self.assertIn("removed 1 leftover", out.getvalue())
+        self.assertFalse(Product.objects.using('default').filter(tenant=self.tenant1).exists())
+        self.assertTrue(Product.objects.using('shard1').filter(pk=self.product1.pk).exists())
+
+    def test_writes_outside_requests_go_to_the_tenant_shard(self):
+        call_command('move_tenant_shard', str(self.tenant1.pk), 'shard1', stdout=StringIO())
+        self.tenant1.refresh_from_db()
+
+        Product.objects.create(tenant=self.tenant1, name="Created", price=1, quantity=1)
+        Product.objects.bulk_create([Product(tenant=self.tenant1, name="Bulk", price=1, quantity=1)])
+        Product(tenant_id=self.tenant1.pk, name="Saved", price=1, quantity=1).save()
+        self.assertEqual(
+            set(Product.objects.using('shard1').filter(tenant=self.tenant1).values_list('name', flat=True)),
+            {"Product 1", "Created", "Bulk", "Saved"}
+        )
+        self.assertFalse(Product.objects.using('default').filter(tenant=self.tenant1).exists())
+
+        with self.assertRaises(ValueError):
+            Product.objects.bulk_create([
+                Product(tenant=self.tenant1, name="Mixed", price=1, quantity=1),
+                Product(tenant=self.tenant2, name="Mixed", price=1, quantity=1),
+            ])
+
+    def test_admin_deletes_products_on_the_tenant_shard(self):
+        call_command('move_tenant_shard', str(self.tenant1.pk), 'shard1', stdout=StringIO())
+        admin_user = User.objects.create_superuser(username="root", password="password123")
+        self.client.force_login(admin_user)
+
+        url = f'/admin/task_api/product/?tenant__id__exact={self.tenant1.pk}'
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True, using='shard1'):
+            response = self.client.post(url, {
+                'action': 'delete_selected', 'post': 'yes', '_selected_action': [self.product1.pk]
+            })
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertIsNotNone(Product.all_objects.using('shard1').get(pk=self.product1.pk).deleted_at)
+        publish.assert_called_once_with(self.tenant1.pk, 'product.deleted', {'id': self.product1.pk})
+
+        response = self.client.get(f'/admin/task_api/product/{self.product1.pk}/change/')
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)  # Deleted products are hidden.
+        self.tenant1.refresh_from_db()
+        other = Product.objects.create(tenant=self.tenant1, name="Still Here", price=1, quantity=1)
+        response = self.client.get(f'/admin/task_api/product/{other.pk}/change/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ProductEventBrokerTest(SimpleTestCase):
+    async def test_publish_to_subscribers_of_the_tenant(self):
+        events = ProductEventBroker(history_size=10, max_pending=10)
+        subscription = events.subscribe(1)
+        other = events.subscribe(2)
+        thread = threading.Thread(target=events.publish, args=(1, 'product.created', {'id': 1}))
+        thread.start()
+        thread.join()
+
+        event = await subscription.get(timeout=1)
+        self.assertEqual(event.type, 'product.created')
+        self.assertIn(b'data: {"id":1}', event.payload)
+        self.assertTrue(other.queue.empty())
+        subscription.close()
+        other.close()
+
+    async def test_resume_from_last_event_id(self):
+        events = ProductEventBroker(history_size=10, max_pending=10)
+        first = events.publish(1, 'product.created', {'id': 1})
+        second = events.publish(1, 'product.updated', {'id': 1})
+        events.publish(2, 'product.created', {'id': 2})
+
+        subscription = events.subscribe(1, last_event_id=first.id)
+        self.assertEqual(subscription.backlog, [second.payload])
+        subscription.close()
+
+        subscription = events.subscribe(1, last_event_id='0-1')
+        self.assertEqual(subscription.backlog, [RESET_EVENT])
+        subscription.close()
+
+    async def test_evicted_history_requires_reset(self):
+        events = ProductEventBroker(history_size=2, max_pending=10)
+        first = events.publish(1, 'product.created', {'id': 1})
+        for product_id in range(2, 5):
+            events.publish(1, 'product.created', {'id': product_id})
+
+        subscription = events.subscribe(1, last_event_id=first.id)
+        self.assertEqual(subscription.backlog[0], RESET_EVENT)
+        self.assertEqual(len(subscription.backlog), 1)
+        subscription.close()
+
+    async def test_history_is_kept_for_recent_tenants_only(self):
+        events = ProductEventBroker(history_size=10, max_pending=10, history_tenants=2)
+        first = events.publish(1, 'product.created', {'id': 1})
+        events.publish(1, 'product.updated', {'id': 1})
+        events.publish(2, 'product.created', {'id': 2})
+        third = events.publish(3, 'product.created', {'id': 3})
+        self.assertEqual(list(events._histories), [2, 3])
+
+        subscription = events.subscribe(1, last_event_id=first.id)
+        self.assertEqual(subscription.backlog, [RESET_EVENT])
+        subscription.close()
+        subscription = events.subscribe(3, last_event_id=third.id)
+        self.assertEqual(subscription.backlog, [])
+        subscription.close()
+
+    async def test_unsubscribe_drops_empty_tenants(self):
+        events = ProductEventBroker(history_size=10, max_pending=10)
+        subscription = events.subscribe(1)
+        subscription.close()
+        self.assertEqual(events._subscribers, {})
+
+    async def test_slow_subscriber_is_cut_off(self):
+        events = ProductEventBroker(history_size=10, max_pending=2)
+        subscription = events.subscribe(1)
+        for product_id in range(5):
+            events.publish(1, 'product.created', {'id': product_id})
+        await asyncio.sleep(0)
+
+        self.assertIsNotNone(await subscription.get(timeout=1))
+        self.assertIsNotNone(await subscription.get(timeout=1))
+        self.assertIs(await subscription.get(timeout=1), subscription.CLOSED)
+        self.assertTrue(subscription.queue.empty())
+        subscription.close()
+
+
+class ProductEventStreamTest(APITestCaseSetup):
+    def history(self, tenant):
+        history = broker._histories.get(tenant.pk)
+        return [event.type for event in history.events] if history is not None else []
+
+    def test_product_signals_publish_events(self):
+        broker._histories.pop(self.tenant1.pk, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(tenant=self.tenant1, name="Streamed", price=1, quantity=1)
+            product.quantity = 2
+            product.save()
+            product.delete()
+        self.assertEqual(self.history(self.tenant1), ['product.created', 'product.updated', 'product.deleted'])
+
+    def test_stream_requires_authentication(self):
+        response = self.client.get('/api/products/events/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_stream_replays_missed_events(self):
+        first = broker.publish(self.tenant1.pk, 'product.created', {'id': 1})
+        second = broker.publish(self.tenant1.pk, 'product.deleted', {'id': 1})
+
+        response = await self.async_client.get(
+            '/api/products/events/',
+            {'access_token': self.token_user1},
+            headers={'Last-Event-ID': first.id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content
+        self.assertEqual(await anext(chunks), b"retry: 3000\n\n")
+        self.assertEqual(await anext(chunks), second.payload)
+        await chunks.aclose()
+
+
+class ProductListRenderingTest(APITestCaseSetup):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(20):
+            Product.objects.create(tenant=cls.tenant1, name=f"Bulk {i}", description=None, price=i + 0.5, quantity=i)
+
+    def test_list_serializer_matches_field_serialization(self):
+        products = list(Product.objects.filter(tenant=self.tenant1))
+        expected = [dict(ProductReadSerializer(product).data) for product in products]
+        self.assertEqual(ProductReadSerializer(products, many=True).data, expected)
+
+    def test_list_is_gzipped_when_accepted(self):
+        response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip', **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(body), 21)
+
+        response = self.client.get('/api/products/', **self.auth_header_user1)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    async def test_event_stream_is_not_compressed(self):
+        response = await self.async_client.get(
+            '/api/products/events/',
+            {'access_token': self.token_user1},
+            headers={'Accept-Encoding': 'gzip'}
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        await response.streaming_content.aclose()
+
+
+class IdempotencyKeyTest(APITestCaseSetup):
+    data = {"name": "Retried Product", "description": "Retry", "price": 5.00, "quantity": 5}
+
+    def post(self, data, key, auth_header=None):
+        return self.client.post(
+            '/api/products/', data, format='json', HTTP_IDEMPOTENCY_KEY=key,
+            **(auth_header or self.auth_header_user1)
+        )
+
+    def test_retry_replays_first_response(self):
+        first = self.post(self.data, 'key-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(3):
+            # The user and their tenant, then the stored response.
+            retry = self.post(self.data, 'key-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Product.objects.filter(name="Retried Product").count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        self.post(self.data, 'key-1')
+        response = self.post(dict(self.data, quantity=6), 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_keys_are_scoped_per_tenant(self):
+        self.post(self.data, 'key-1')
+        response = self.post(self.data, 'key-1', auth_header=self.auth_header_user2)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Product.objects.filter(name="Retried Product").count(), 2)
+
+    def test_failed_requests_are_not_recorded(self):
+        response = self.post(dict(self.data, name="Product 1"), 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_delete_replay(self):
+        url = f'/api/products/{self.product1.id}/'
+        response = self.client.delete(url, HTTP_IDEMPOTENCY_KEY='delete-1', **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.delete(url, HTTP_IDEMPOTENCY_KEY='delete-1', **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_replay_keeps_location_header(self):
+        with mock.patch.object(
+            ProductListCreateAPIView, 'get_success_headers', return_value={'Location': '/api/products/42/'}
+        ):
+            first = self.post(self.data, 'key-1')
+        self.assertEqual(first['Location'], '/api/products/42/')
+        retry = self.post(self.data, 'key-1')
+        self.assertEqual(retry['Location'], '/api/products/42/')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_abandoned_claim_is_taken_over(self):
+        # A first attempt whose worker died before its response was stored.
+        self.post(self.data, 'key-1')
+        Product.all_objects.filter(name="Retried Product").delete()
+        IdempotencyKey.objects.update(status_code=None, response_body='')
+
+        response = self.post(self.data, 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        IdempotencyKey.objects.update(created=timezone.now() - settings.IDEMPOTENCY_KEY_LOCK_TIMEOUT)
+        response = self.post(self.data, 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        record = IdempotencyKey.objects.get(tenant=self.tenant1, key='key-1')
+        self.assertEqual(record.status_code, status.HTTP_201_CREATED)
+
+    def test_expired_keys_are_not_replayed(self):
+        self.post(self.data, 'key-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        response = self.post(self.data, 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class CachedTokenTest(APITestCaseSetup):
+    credentials = {'username': 'user1', 'password': 'password123'}
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def login(self, credentials=None):
+        # Cache entries are written on commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/login/', credentials or self.credentials)
+
+    def test_repeated_login_skips_queries(self):
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(RefreshToken(response.data['refresh'])['tenant_id'], self.tenant1.pk)
+
+        with self.assertNumQueries(0):
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            response = self.login({'username': 'user1', 'password': 'wrongpassword'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(LOGIN_CACHE_VERIFIED_CREDENTIALS=True)
+    def test_verified_credentials_skip_hashing(self):
+        self.login()
+        with mock.patch('task_api.tokens.check_password') as check_password:
+            self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+            check_password.assert_not_called()
+
+            check_password.return_value = False
+            response = self.login({'username': 'user1', 'password': 'wrongpassword'})
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            check_password.assert_called_once()
+
+    def test_refresh_without_queries(self):
+        refresh = self.login().data['refresh']
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+
+    def test_revoked_refresh_token_is_rejected(self):
+        refresh = self.login().data['refresh']
+        response = self.client.post('/api/token/revoke/', {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates_cache_and_tokens(self):
+        refresh = self.login().data['refresh']
+        self.user_tenant1.set_password('newpassword123')
+        self.user_tenant1.save()
+
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.login({'username': 'user1', 'password': 'newpassword123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rolled_back_login_is_not_cached(self):
+        self.client.post('/api/login/', self.credentials)
+        self.assertIsNone(get_cached_user('user1'))
+
+    def test_tokens_from_stale_cache_entry_are_rejected(self):
+        self.login()
+        # update() skips the signals that drop the cache entry.
+        new_password = make_password('newpassword123')
+        User.objects.filter(pk=self.user_tenant1.pk).update(password=new_password)
+
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        header = {'HTTP_AUTHORIZATION': f"Bearer {response.data['access']}"}
+        response = self.client.get('/api/products/', **header)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_cannot_login(self):
+        self.login()
+        self.user_tenant1.is_active = False
+        self.user_tenant1.save()
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False, PURGE_BATCH_SIZE=2)
+class SoftDeleteTest(APITestCaseSetup):
+    # Purges sweep every configured database.
+    databases = '__all__'
+
+    def test_delete_is_soft(self):
+        response = self.client.delete(f'/api/products/{self.product1.id}/', **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Product.objects.filter(pk=self.product1.pk).exists())
+        self.assertIsNotNone(Product.all_objects.get(pk=self.product1.pk).deleted_at)
+
+        response = self.client.get(f'/api/products/{self.product1.id}/', **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # The name is free again for a new product.
+        data = {"name": "Product 1", "price": 1.00, "quantity": 1}
+        response = self.client.post('/api/products/', data, **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_purge_deleted_products(self):
+        for i in range(5):
+            Product.objects.create(tenant=self.tenant1, name=f"Old {i}", price=1, quantity=1).soft_delete()
+        self.assertEqual(purge_deleted_products(), 5)
+        self.assertEqual(Product.all_objects.filter(tenant=self.tenant1).count(), 1)
+
+    def test_soft_delete_tenant_purges_in_background(self):
+        for i in range(5):
+            Product.objects.create(tenant=self.tenant1, name=f"Extra {i}", price=1, quantity=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            soft_delete_tenant(self.tenant1)
+            self.assertFalse(Tenant.objects.filter(pk=self.tenant1.pk).exists())
+            self.assertFalse(User.objects.get(pk=self.user_tenant1.pk).is_active)
+            response = self.client.get('/api/products/', **self.auth_header_user1)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.assertFalse(Tenant.all_objects.filter(pk=self.tenant1.pk).exists())
+        self.assertFalse(Product.all_objects.filter(tenant_id=self.tenant1.pk).exists())
+        self.assertFalse(User.objects.filter(pk=self.user_tenant1.pk).exists())
+        self.assertTrue(Product.objects.filter(pk=self.product2.pk).exists())
+
+    def test_soft_delete_tenant_does_not_scale_with_users(self):
+        for i in range(5):
+            User.objects.create_user(username=f"extra{i}", password="password123", tenant=self.tenant1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/login/', {'username': 'user1', 'password': 'password123'})
+        self.assertIsNotNone(get_cached_user('user1'))
+
+        with self.captureOnCommitCallbacks() as callbacks, self.assertMaxQueries(4):
+            # A savepoint, the tenant and user updates, and its release.
+            soft_delete_tenant(self.tenant1)
+        self.assertIsNotNone(get_cached_user('user1'))
+
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(get_cached_user('user1'))
+
+    def test_admin_delete_requires_permission_on_purged_models(self):
+        staff = User.objects.create_user(username="staff", password="password123", tenant=self.tenant2, is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename='delete_tenant'))
+        request = RequestFactory().post('/')
+        request.user = User.objects.get(pk=staff.pk)
+        tenant_admin = admin.site._registry[Tenant]
+
+        perms_needed = tenant_admin.get_deleted_objects([self.tenant1], request)[2]
+        self.assertEqual(perms_needed, {'user', 'product', 'import job', 'idempotency key'})
+
+        request.user = User.objects.get(pk=self.user_tenant1.pk)
+        request.user.is_superuser = True
+        self.assertEqual(tenant_admin.get_deleted_objects([self.tenant1], request)[2], set())
+
+    def test_deleted_tenant_name_can_be_reused_before_purge(self):
+        soft_delete_tenant(self.tenant1)
+        tenant = Tenant(name="Tenant 1")
+        tenant.full_clean()
+        tenant.save()
+        self.assertEqual(Tenant.all_objects.filter(name="Tenant 1").count(), 2)
+
+        with self.assertRaises(ValidationError):
+            Tenant(name="Tenant 1").full_clean()
+
+
+class EndpointQueryCountTest(APITestCaseSetup):
+    # Budgets include the user and tenant lookups done by authentication.
+    def setUp(self):
+        cache.clear()
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        self.assertEndpointQueries(4, 'get', '/api/products/', **self.auth_header_user1)
+        Product.objects.bulk_create(
+            Product(tenant=self.tenant1, name=f"Extra {i}", price=1.00, quantity=1) for i in range(25)
+        )
+        response = self.assertEndpointQueries(4, 'get', '/api/products/', **self.auth_header_user1)
+        self.assertEqual(len(response.data), 26)
+
+    def test_product_detail_and_writes(self):
+        detail = f'/api/products/{self.product1.id}/'
+        self.assertEndpointQueries(4, 'get', detail, **self.auth_header_user1)
+        # Creating allocates the id: a savepoint, UPDATE and SELECT on the sequence.
+        self.assertEndpointQueries(
+            8, 'post', '/api/products/', {"name": "Budget Product", "price": 1.00, "quantity": 1},
+            expected_status=status.HTTP_201_CREATED, **self.auth_header_user1
+        )
+        self.assertEndpointQueries(6, 'patch', detail, {"price": 2.00}, **self.auth_header_user1)
+        self.assertEndpointQueries(
+            6, 'delete', detail, expected_status=status.HTTP_204_NO_CONTENT, **self.auth_header_user1
+        )
+
+    def test_bulk_update_is_a_single_statement(self):
+        # One query checks the new prices fit the column before the update.
+        data = {"filter": {"name_prefix": "Product"}, "update": {"price": {"op": "percent", "value": "5"}}}
+        with self.assertMaxQueries(6) as context:
+            response = self.client.post('/api/products/bulk-update/', data, format='json', **self.auth_header_user1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+    def test_import_list(self):
+        self.assertEndpointQueries(3, 'get', '/api/products/imports/', **self.auth_header_user1)
+
+    def test_login_and_refresh(self):
+        credentials = {'username': 'user1', 'password': 'password123'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEndpointQueries(1, 'post', '/api/login/', credentials)
+        response = self.assertEndpointQueries(0, 'post', '/api/login/', credentials)
+        self.assertEndpointQueries(0, 'post', '/api/token/refresh/', {'refresh': response.data['refresh']})
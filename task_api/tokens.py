@@ -0,0 +1,121 @@
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+USER_CACHE_KEY = 'auth:user:{}'
+REVOKED_TOKEN_KEY = 'auth:revoked:{}'
+REVOKED_BEFORE_KEY = 'auth:revoked-before:{}'
+
+# Fields needed to check a password and issue tokens without a query.
+CACHED_USER_FIELDS = ('id', 'username', 'password', 'is_active', 'is_superuser', 'tenant_id')
+
+
+class TenantRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user's tenant, so clients and refreshed access
+    tokens get it without a lookup.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['tenant_id'] = user.tenant_id
+        return token
+
+
+def credential_digest(user, raw_password):
+    # Keyed on SECRET_KEY and the stored hash, so a password change or a
+    # leaked cache alone does not make the digest usable.
+    return salted_hmac('task_api.login-cache', f"{user.password}\0{raw_password}", algorithm='sha256').hexdigest()
+
+
+def cache_user(user, raw_password=None):
+    """
+    Cache what the login endpoint needs about ``user``. With
+    ``LOGIN_CACHE_VERIFIED_CREDENTIALS`` enabled, a keyed digest of the
+    password just verified is cached too, letting repeated logins skip the
+    password hasher until the entry expires.
+
+    The entry is written once the current transaction commits, so a user
+    row that is rolled back never reaches the cache. Tokens issued from an
+    entry carry its ``id`` and a hash of its ``password``, which
+    authentication checks against the row (``CHECK_REVOKE_TOKEN``).
+    """
+    data = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+    if raw_password is not None and settings.LOGIN_CACHE_VERIFIED_CREDENTIALS:
+        data['credential'] = credential_digest(user, raw_password)
+    key = USER_CACHE_KEY.format(user.get_username())
+    transaction.on_commit(lambda: cache.set(key, data, settings.LOGIN_CACHE_TTL))
+
+
+def get_cached_user(username):
+    """
+    Return an unsaved ``User`` built from the login cache, or ``None``.
+    """
+    data = cache.get(USER_CACHE_KEY.format(username))
+    if data is None:
+        return None
+    credential = data.pop('credential', None)
+    user = get_user_model()(**data)
+    user.cached_credential = credential
+    return user
+
+
+def check_cached_password(user, raw_password):
+    """
+    Check ``raw_password`` for a user from ``get_cached_user``. Returns
+    ``(valid, hashed)``, ``hashed`` telling whether the hasher had to run.
+    """
+    if user.cached_credential is not None and constant_time_compare(
+        user.cached_credential, credential_digest(user, raw_password)
+    ):
+        return True, False
+    return check_password(raw_password, user.password), True
+
+
+def invalidate_cached_user(username):
+    """
+    Drop the login cache entry of ``username``. Saving or deleting a user
+    does this through signals; code changing ``password``, ``is_active`` or
+    ``tenant`` with ``QuerySet.update()`` must call it for each user.
+    """
+    cache.delete(USER_CACHE_KEY.format(username))
+
+
+def _seconds_until_expiry(token):
+    return max(int(token['exp'] - time.time()), 1)
+
+
+def revoke_token(token):
+    cache.set(REVOKED_TOKEN_KEY.format(token[api_settings.JTI_CLAIM]), True, _seconds_until_expiry(token))
+
+
+def revoke_user_tokens(user_id):
+    """
+    Revoke every refresh token issued to the user until now. Tokens issued in
+    the current second are included, as ``iat`` only has second precision.
+    """
+    cache.set(
+        REVOKED_BEFORE_KEY.format(user_id),
+        math.floor(time.time()) + 1,
+        int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    )
+
+
+def is_revoked(token):
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    keys = [REVOKED_TOKEN_KEY.format(token[api_settings.JTI_CLAIM]), REVOKED_BEFORE_KEY.format(user_id)]
+    values = cache.get_many(keys)
+    if values.get(keys[0]):
+        return True
+    revoked_before = values.get(keys[1])
+    return revoked_before is not None and token['iat'] < revoked_before
@@ -6,4 +6,8 @@ from . import views
 urlpatterns = [
     path('products/', views.ProductListCreateAPIView.as_view(), name='product-list-create'),
     path('products/<int:pk>/', views.ProductRetrieveUpdateDestroyAPIView.as_view(), name='product-detail'),
+    path('products/events/', views.product_events, name='product-events'),
+    path('products/bulk-update/', views.ProductBulkUpdateAPIView.as_view(), name='product-bulk-update'),
+    path('products/imports/', views.ProductImportListCreateAPIView.as_view(), name='product-import-list-create'),
+    path('products/imports/<int:pk>/', views.ProductImportRetrieveAPIView.as_view(), name='product-import-detail'),
 ]
@@ -1,16 +1,60 @@
-from rest_framework import generics
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import generics, status
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 import django.core.exceptions
-from rest_framework.exceptions import ValidationError as DRFValidationError
+from django.db import DataError, IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed, ValidationError as DRFValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenViewBase
 
-from .models import Product
-from .serializers import ProductReadSerializer, ProductWriteSerializer
+from .events import broker
+from .idempotency import idempotent
+from .imports import enqueue_import_job
+from .models import ImportJob, Product
+from .sharding import activate_tenant, deactivate_tenant
+from .signals import products_bulk_updated
+from .serializers import (
+    CachedTokenObtainPairSerializer,
+    CachedTokenRefreshSerializer,
+    ImportJobCreateSerializer,
+    ImportJobSerializer,
+    ProductBulkUpdateSerializer,
+    ProductReadSerializer,
+    ProductWriteSerializer,
+    TokenRevokeSerializer,
+)
 
 
 
 
-class ProductListCreateAPIView(generics.ListCreateAPIView):
+class TenantShardMixin:
+    """
+    Route sharded queries made while handling the request to the database
+    of the authenticated user's tenant.
+    """
+    _shard_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._shard_token = activate_tenant(getattr(request.user, 'tenant', None))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._shard_token is not None:
+            deactivate_tenant(self._shard_token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ProductListCreateAPIView(TenantShardMixin, generics.ListCreateAPIView):
     """
     List all products or create a new products.
     """
@@ -41,6 +85,7 @@ class ProductListCreateAPIView(generics.ListCreateAPIView):
             400: "Bad Request"
         }
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
@@ -54,7 +99,7 @@ class ProductListCreateAPIView(generics.ListCreateAPIView):
             raise DRFValidationError(e.message_dict)
 
 
-class ProductRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ProductRetrieveUpdateDestroyAPIView(TenantShardMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a product
     """
@@ -85,6 +130,7 @@ class ProductRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView)
             400: "Bad Request"
         }
     )
+    @idempotent
     def put(self, request, *args, **kwargs):
         return super().put(request, *args, **kwargs)
 
@@ -96,6 +142,7 @@ class ProductRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView)
             400: "Bad Request"
         }
     )
+    @idempotent
     def patch(self, request, *args, **kwargs):
         return super().patch(request, *args, **kwargs)
 
@@ -106,7 +153,213 @@ class ProductRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView)
             404: "Not Found"
         }
     )
+    @idempotent
     def delete(self, request, *args, **kwargs):
         return super().delete(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        """
+        Soft-delete the product; the background purge removes the row.
+        """
+        instance.soft_delete()
+
+
+class ProductBulkUpdateAPIView(TenantShardMixin, generics.GenericAPIView):
+    """
+    Apply one change set to every product of the tenant matching a filter.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ProductBulkUpdateSerializer
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Update all of the tenant's products matching `filter` in a single query. "
+            "`price` supports `set`, `percent` and `delta`; `quantity` supports `set` and `delta`; "
+            "`description` supports `set`."
+        ),
+        request_body=ProductBulkUpdateSerializer,
+        responses={
+            200: "Number of updated products",
+            400: "Bad Request"
+        }
+    )
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tenant = request.user.tenant
+        filters = serializer.get_filter_kwargs()
+        changes = serializer.get_update_kwargs()
+
+        using = router.db_for_write(Product)
+        try:
+            with transaction.atomic(using=using):
+                products = Product.objects.filter(tenant=tenant, **filters)
+                if serializer.has_out_of_range_values(products, changes):
+                    raise DRFValidationError({"update": ["The update would produce invalid values for some products."]})
+                # update() bypasses save(), so the modified timestamp is set explicitly.
+                count = products.update(
+                    modified=timezone.now(),
+                    **changes
+                )
+        except (IntegrityError, DataError):
+            raise DRFValidationError({"update": ["The update would produce invalid values for some products."]})
+
+        if count:
+            transaction.on_commit(lambda: products_bulk_updated.send(
+                sender=Product,
+                tenant=tenant,
+                filters=filters,
+                fields=list(changes),
+                count=count
+            ), using=using)
+        return Response({"updated": count})
+
+
+class ProductImportListCreateAPIView(generics.ListCreateAPIView):
+    """
+    List product import jobs or upload a file to start a new one.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ImportJob.objects.none()
+        # The raw upload is only needed by the worker, not for status polling.
+        return ImportJob.objects.filter(tenant=self.request.user.tenant).defer('source')
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return ImportJobSerializer
+        return ImportJobCreateSerializer
+
+    @swagger_auto_schema(
+        operation_description="Retrieve all product import jobs for the logged-in user's tenant.",
+        responses={200: ImportJobSerializer(many=True)}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    @swagger_auto_schema(
+        operation_description="Upload a CSV or NDJSON file of products to import in the background.",
+        request_body=ImportJobCreateSerializer,
+        responses={
+            202: ImportJobSerializer,
+            400: "Bad Request"
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = ImportJob.objects.create(
+            tenant=request.user.tenant,
+            created_by=request.user,
+            format=serializer.validated_data['format'],
+            source=serializer.validated_data['source']
+        )
+        enqueue_import_job(job)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class ProductImportRetrieveAPIView(generics.RetrieveAPIView):
+    """
+    Retrieve the status, progress and row errors of a product import job.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ImportJobSerializer
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ImportJob.objects.none()
+        return ImportJob.objects.filter(tenant=self.request.user.tenant).defer('source')
+
+    @swagger_auto_schema(
+        operation_description="Retrieve an import job by ID (only if it belongs to the current tenant).",
+        responses={200: ImportJobSerializer}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class CachedTokenObtainPairView(TokenObtainPairView):
+    """
+    Obtain an access and refresh token pair, using the login cache.
+    """
+    serializer_class = CachedTokenObtainPairSerializer
+
+
+class CachedTokenRefreshView(TokenRefreshView):
+    """
+    Obtain a new access token from a refresh token that has not been revoked.
+    """
+    serializer_class = CachedTokenRefreshSerializer
+
+
+class TokenRevokeView(TokenViewBase):
+    """
+    Revoke a refresh token so it can no longer be used.
+    """
+    serializer_class = TokenRevokeSerializer
+
+
+def _authenticate_event_stream(request):
+    """
+    Authenticate with the usual ``Authorization: Bearer`` header, or with an
+    ``access_token`` query parameter since browsers' EventSource cannot send
+    headers.
+    """
+    authentication = JWTAuthentication()
+    try:
+        result = authentication.authenticate(request)
+        if result is not None:
+            return result[0]
+        raw_token = request.GET.get('access_token')
+        if raw_token:
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken):
+        pass
+    return None
+
+
+async def product_events(request):
+    """
+    Stream create/update/delete events for the tenant's products as
+    server-sent events. Reconnecting clients send ``Last-Event-ID`` to
+    receive the events they missed.
+    """
+    user = await sync_to_async(_authenticate_event_stream)(request)
+    if user is None or user.tenant_id is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided or are invalid."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    tenant_id = user.tenant_id
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    heartbeat = settings.PRODUCT_EVENTS_HEARTBEAT
+
+    async def stream():
+        subscription = broker.subscribe(tenant_id, last_event_id)
+        try:
+            yield b"retry: 3000\n\n"
+            for payload in subscription.backlog:
+                yield payload
+            subscription.backlog = []
+            while True:
+                try:
+                    event = await subscription.get(timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is subscription.CLOSED:
+                    # Too far behind; the client reconnects and resumes.
+                    return
+                yield event.payload
+        finally:
+            subscription.close()
 
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response